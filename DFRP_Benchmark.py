@@ -0,0 +1,162 @@
+# Directory of Federal Real Property (DFRP) exporter benchmark
+# Tested with Python 2.7.10
+
+# Generates synthetic dumps of each size with DFRP_Generate.py, exports each with DFRP_XML.py in each of the output
+# modes below, and reports Properties/sec, rows/sec, MB/sec of XML read, peak resident memory, CPU time in the main and
+# worker processes, and the time spent writing each output table
+# Usage: python DFRP_Benchmark.py [number of Properties ...]
+#        Results are also written to benchmark_path as JSON, to compare with earlier runs
+# Note: Each export runs in a fresh Python process, so peak memory is measured for that export alone
+#       Peak memory and CPU time are not available on Windows
+#       Stage times come from DFRP_XML.py's metrics; output written by SQLite and Parquet in batches counts towards the
+#       table whose rows filled the batch, or towards finish for the last batch
+
+# License: CC-BY-SA (see https://creativecommons.org/licenses/by-sa/4.0/legalcode)
+
+
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import DFRP_Generate
+
+# optional, for peak memory
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# numbers of Properties to generate, when not given on the command line (the real dump has about 20,000)
+sizes = [2000, 20000]
+
+# output modes to benchmark: name, and DFRP_XML settings
+modes = [
+    ('csv', {}),
+    ('csv, %d processes' % max(2, multiprocessing.cpu_count()), {'processes': max(2, multiprocessing.cpu_count())}),
+    ('csv, bilingual', {'languages': ['E', 'F']}),
+    ('sqlite', {'output_format': 'sqlite'}),
+    ('parquet', {'output_format': 'parquet'})]
+
+# results file (None to only print the results)
+benchmark_path = 'benchmark.json'
+
+
+# function to return the peak resident memory of this process and of its finished child processes, in MB
+def peak_memory():
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+# function to return the CPU time used by this process, and by its finished child processes (the export's workers), in
+# seconds (None if it is not available); with several processes, the export can take no less time than this process's
+# CPU time however many cores there are
+def cpu_seconds():
+    if resource is None:
+        return None, None
+    usages = [resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)]
+    return tuple(usage.ru_utime + usage.ru_stime for usage in usages)
+
+
+# function run in a fresh process to export the dump in directory with the given DFRP_XML settings, and print its
+# metrics as JSON
+def run_export(directory, settings):
+    import DFRP_XML
+    DFRP_XML.configure(starting_path=directory, metrics_path=directory + 'metrics.json', **settings)
+    # CPU time is measured around the export, leaving out starting Python and importing DFRP_XML and its packages
+    start_cpu = cpu_seconds()
+    start = time.time()
+    DFRP_XML.export()
+    seconds = time.time() - start
+    end_cpu = cpu_seconds()
+    with open(DFRP_XML.metrics_path, 'r') as metrics_file:
+        measurements = json.load(metrics_file)
+    measurements['seconds'] = seconds
+    measurements['peak_memory'] = peak_memory()
+    if resource is None:
+        measurements['main_cpu_seconds'], measurements['worker_cpu_seconds'] = None, None
+    else:
+        measurements['main_cpu_seconds'], measurements['worker_cpu_seconds'] = [after - before for before, after
+                                                                                 in zip(start_cpu, end_cpu)]
+    json.dump(measurements, sys.stdout)
+
+
+# function to benchmark each output mode on a generated dump of each size, returning the results
+def benchmark(sizes):
+    results = []
+    directory = tempfile.mkdtemp(prefix='dfrp-benchmark-')
+    try:
+        for size in sizes:
+            xml_path = os.path.join(directory, 'dfrp-rbif.xml')
+            DFRP_Generate.generate(xml_path, size)
+            megabytes = os.path.getsize(xml_path) / (1024.0 * 1024.0)
+            for name, settings in modes:
+                if settings.get('output_format') == 'parquet' and not has_pyarrow():
+                    print('%d Properties, %s: skipped, pyarrow is not installed' % (size, name))
+                    continue
+                measurements = json.loads(subprocess.check_output([sys.executable, os.path.abspath(__file__), '--run',
+                                                                   directory + os.sep, json.dumps(settings)]))
+                seconds = measurements['seconds']
+                stages = measurements['stages']
+                result = {'properties': size, 'mode': name, 'xml_megabytes': megabytes, 'seconds': seconds,
+                          'properties_per_second': measurements['properties'] / seconds,
+                          'rows_per_second': sum(measurements['rows'].values()) / seconds,
+                          'megabytes_per_second': megabytes / seconds,
+                          'peak_memory_megabytes': measurements['peak_memory'],
+                          'main_cpu_seconds': measurements['main_cpu_seconds'],
+                          'worker_cpu_seconds': measurements['worker_cpu_seconds'],
+                          'rows': measurements['rows'],
+                          'write_seconds': stages.pop('write'),
+                          'stage_seconds': stages}
+                results.append(result)
+                print_result(result)
+                for file_name in os.listdir(directory):
+                    if file_name != 'dfrp-rbif.xml':
+                        os.remove(os.path.join(directory, file_name))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+# function to check whether pyarrow, needed for Parquet output, is installed
+def has_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+
+# function to print a benchmark result, with the stages and tables that took longest first
+def print_result(result):
+    memory = result['peak_memory_megabytes']
+    print('%d Properties (%.1f MB), %s: %.2f s, %.0f Properties/s, %.0f rows/s, %.2f MB/s, peak memory %s' % (
+        result['properties'], result['xml_megabytes'], result['mode'], result['seconds'],
+        result['properties_per_second'], result['rows_per_second'], result['megabytes_per_second'],
+        '%.0f MB' % memory if memory is not None else 'n/a'))
+    if result['main_cpu_seconds'] is not None:
+        print('    CPU time: %.2f s in the main process, %.2f s in worker processes' % (result['main_cpu_seconds'],
+                                                                                     result['worker_cpu_seconds']))
+    for stage, seconds in sorted(result['stage_seconds'].items(), key=lambda item: -item[1]):
+        print('    %-32s %8.3f s' % (stage, seconds))
+    for table_name, seconds in sorted(result['write_seconds'].items(), key=lambda item: -item[1]):
+        print('    %-32s %8.3f s %10d rows' % ('write ' + table_name, seconds, result['rows'][table_name]))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--run':
+        run_export(sys.argv[2], json.loads(sys.argv[3]))
+    else:
+        results = benchmark([int(size) for size in sys.argv[1:]] or sizes)
+        if benchmark_path is not None:
+            with open(benchmark_path, 'w') as results_file:
+                json.dump(results, results_file, indent=2, sort_keys=True)
@@ -0,0 +1,321 @@
+# Directory of Federal Real Property (DFRP) exporter checks
+# Tested with Python 2.7.10
+
+# Exports small dumps generated with DFRP_Generate.py with DFRP_XML.py, and checks the behaviour of its stateful and
+# algorithmic parts against the expected results worked out independently: the rows written by incremental exports,
+# the spatial index's bounding box and nearest neighbour queries, compared with a brute force search, and the parse
+# cache's hits, misses, skipped runs and evictions
+# Usage: python DFRP_Check.py
+#        Prints each check as it passes, and stops with an AssertionError at the first that fails
+
+# License: CC-BY-SA (see https://creativecommons.org/licenses/by-sa/4.0/legalcode)
+
+
+import collections
+import hashlib
+import io
+import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+
+import unicodecsv as csv
+
+import DFRP_Generate
+import DFRP_XML
+
+
+# DFRP_XML settings as they are at the top of DFRP_XML.py, restored before each export
+default_settings = dict((name, getattr(DFRP_XML, name)) for name in DFRP_XML.setting_names)
+
+
+# function to export the dump in directory, dfrp-rbif.xml, to directory with the given DFRP_XML settings
+def export(directory, **settings):
+    DFRP_XML.configure(**default_settings)
+    DFRP_XML.configure(starting_path=directory, **settings)
+    DFRP_XML.export()
+
+
+# function to return the header and rows of a CSV output table
+def read_table(directory, table_name):
+    with open(os.path.join(directory, table_name + '.csv'), 'rb') as table_file:
+        rows = list(csv.reader(table_file, encoding='utf-8'))
+    return rows[0], rows[1:]
+
+
+# function to return the rows of each output table, keyed by table name, grouped by the Property_Number they belong to
+def property_rows(directory, suffix=''):
+    grouped = {}
+    for table_name in DFRP_XML.table_names[1:]:
+        header, rows = read_table(directory, table_name + suffix)
+        number_index = header.index('Property_Number')
+        grouped[table_name] = collections.defaultdict(list)
+        for row in rows:
+            grouped[table_name][row[number_index]].append(row)
+    return grouped
+
+
+# function to return the sorted keys of the rows of a delta table
+def row_keys(table, rows):
+    return sorted(table.key(row[1:]) for row in rows)
+
+
+# function to return the start and end offsets of the Property with property_number in an XML dump's text
+def property_span(xml, property_number):
+    position = xml.index(u'<Property_Number>%s</Property_Number>' % property_number)
+    return xml.rindex(u'<Property ', 0, position), xml.index(u'</Property>', position) + len(u'</Property>')
+
+
+# function to rewrite the dump in directory: change the lastModifiedDate of the Property with modified_number, and
+# remove the Property with removed_number
+def change_dump(directory, modified_number, removed_number):
+    path = os.path.join(directory, 'dfrp-rbif.xml')
+    with io.open(path, 'r', encoding='utf-8') as xml_file:
+        xml = xml_file.read()
+    start, end = property_span(xml, modified_number)
+    xml = xml[:start] + re.sub(u'lastModifiedDate="[^"]*"', u'lastModifiedDate="2020-01-01T00:00:00"', xml[start:end],
+                               1) + xml[end:]
+    start, end = property_span(xml, removed_number)
+    xml = xml[:start] + xml[end:]
+    with io.open(path, 'w', encoding='utf-8', newline='\n') as xml_file:
+        xml_file.write(xml)
+
+
+# function to repeat the first Photo of every Photos element in the dump in directory, so that photo keys are not unique
+def duplicate_photos(directory):
+    path = os.path.join(directory, 'dfrp-rbif.xml')
+    with io.open(path, 'r', encoding='utf-8') as xml_file:
+        xml = xml_file.read()
+    xml = re.sub(u'<Photos>(<Photo[ >].*?</Photo>)', u'<Photos>\\1\\1', xml)
+    with io.open(path, 'w', encoding='utf-8', newline='\n') as xml_file:
+        xml_file.write(xml)
+
+
+# function to check that a first incremental export writes every row as an insert, even rows with the same key, that a
+# second, after one Property is modified and another removed, writes updates for the modified Property and the rows
+# that belong to it, deletes for every row of the removed one, and nothing else; and that a third export of the same
+# dump writes no changes
+def check_delta(directory):
+    DFRP_Generate.generate(os.path.join(directory, 'dfrp-rbif.xml'), 200, 1)
+    duplicate_photos(directory)
+    full = os.path.join(directory, 'full') + os.sep
+    os.mkdir(full)
+    export(full, input_path=os.path.join(directory, 'dfrp-rbif.xml'))
+    state_path = os.path.join(directory, 'delta_state.json')
+    export(directory, delta_state_path=state_path)
+    first = property_rows(directory, '_delta')
+    for table_name, grouped in property_rows(full).items():
+        assert (sorted(row for rows in grouped.values() for row in rows) ==
+                sorted(row[1:] for rows in first[table_name].values() for row in rows)), \
+            '%s: first run did not write every row' % table_name
+    for table_name, grouped in first.items():
+        for rows in grouped.values():
+            assert all(row[0] == 'insert' for row in rows), '%s: first run wrote changes besides inserts' % table_name
+
+    # a Property with structures and repeated photos to modify, and another to remove
+    numbers = sorted(number for number in first['structure']
+                     if len(first['structure'][number]) > 0 and len(first['property_photo'][number]) > 0)
+    modified_number, removed_number = numbers[0], numbers[-1]
+    change_dump(directory, modified_number, removed_number)
+    export(directory, delta_state_path=state_path)
+    second = property_rows(directory, '_delta')
+    for table_name in DFRP_XML.table_names[1:]:
+        table = DFRP_XML.tables[table_name]
+        changes = second[table_name]
+        assert set(changes) <= set([modified_number, removed_number]), \
+            '%s: changes written for unchanged Properties' % table_name
+        removed = changes.get(removed_number, [])
+        assert len(removed) == len(first[table_name][removed_number]) and all(row[0] == 'delete' for row in removed), \
+            '%s: the rows of the removed Property were not all deleted' % table_name
+        assert row_keys(table, removed) == row_keys(table, first[table_name][removed_number]), \
+            '%s: deleted rows have the wrong keys' % table_name
+        modified = changes.get(modified_number, [])
+        if DFRP_XML.dated_table(table).name == 'property':
+            # rows compared through the Property's dates are written again as updates
+            assert row_keys(table, modified) == row_keys(table, first[table_name][modified_number]), \
+                '%s: the rows of the modified Property were not all written' % table_name
+            assert all(row[0] == 'update' for row in modified), '%s: modified rows are not updates' % table_name
+            if table_name == 'property':
+                assert modified[0][1 + table.header.index('lastModifiedDate')] == '2020-01-01T00:00:00', \
+                    'property: the update does not have the new lastModifiedDate'
+        else:
+            # structures have their own dates, which did not change
+            assert len(modified) == 0, '%s: unchanged structure rows were written' % table_name
+
+    export(directory, delta_state_path=state_path)
+    third = property_rows(directory, '_delta')
+    for table_name, grouped in third.items():
+        assert len(grouped) == 0, '%s: changes written for an unchanged dump' % table_name
+    print('delta: insert, update and delete rows are correct')
+
+
+# function to return the (kind, key) of the points of a spatial index inside a bounding box, by testing every point
+def brute_force_bbox(index, min_latitude, min_longitude, max_latitude, max_longitude, kinds=None):
+    results = []
+    for latitude, longitude, kind, key in index.points:
+        if min_longitude <= max_longitude:
+            inside_longitude = min_longitude <= longitude <= max_longitude
+        else:
+            inside_longitude = longitude >= min_longitude or longitude <= max_longitude
+        if min_latitude <= latitude <= max_latitude and inside_longitude and (kinds is None or kind in kinds):
+            results.append((kind, key))
+    return results
+
+
+# function to check the spatial index's bbox() and nearest() queries against a brute force search of 20,000 random
+# points, including boxes that cross the 180th meridian and locations near the poles, and that an index saved by an
+# export holds every parcel and structure location
+def check_spatial_index(directory):
+    generator = random.Random(1)
+    index = DFRP_XML.SpatialIndex()
+    for number in range(20000):
+        index.add(generator.choice(['parcel', 'structure']), [u'%05d' % number], generator.uniform(-90, 90),
+                  generator.uniform(-180, 180))
+    index.save(os.path.join(directory, 'spatial_index.json'))
+    loaded = DFRP_XML.SpatialIndex.load(os.path.join(directory, 'spatial_index.json'))
+    assert loaded.points == index.points, 'spatial index: points changed when saved and loaded'
+
+    for _ in range(500):
+        min_latitude = generator.uniform(-95, 90)
+        max_latitude = min_latitude + generator.uniform(0, 40)
+        min_longitude = generator.uniform(-180, 180)
+        # boxes whose east edge is past 180 degrees wrap around, with min_longitude greater than max_longitude
+        max_longitude = min_longitude + generator.uniform(0, 60)
+        if max_longitude > 180:
+            max_longitude -= 360
+        kinds = generator.choice([None, ['parcel']])
+        box = (min_latitude, min_longitude, max_latitude, max_longitude)
+        assert sorted(index.bbox(*box, kinds=kinds)) == sorted(brute_force_bbox(index, *box, kinds=kinds)), \
+            'spatial index: bbox%r differs from a brute force search' % (box,)
+
+    every_point = range(len(index.points))
+    for _ in range(300):
+        latitude = generator.choice([generator.uniform(-90, 90), generator.uniform(85, 90),
+                                     generator.uniform(-90, -85)])
+        longitude = generator.uniform(-180, 180)
+        k = generator.randint(1, 20)
+        kinds = generator.choice([None, ['structure']])
+        expected = sorted(index.distances(latitude, longitude, every_point, kinds))[:k]
+        assert index.nearest(latitude, longitude, k, kinds) == expected, \
+            'spatial index: nearest(%r, %r, %d) differs from a brute force search' % (latitude, longitude, k)
+
+    # asking for more points than match, or for a kind with no points, returns every matching point once the search
+    # covers the occupied cells, rather than widening to the whole globe
+    clustered = DFRP_XML.SpatialIndex()
+    for number in range(300):
+        clustered.add(generator.choice(['parcel', 'structure']), [u'%05d' % number], generator.uniform(60, 62),
+                      generator.uniform(-120, -118))
+    every_point = range(len(clustered.points))
+    for k, kinds in [(1000, None), (1000, ['parcel']), (10, ['building'])]:
+        expected = sorted(clustered.distances(-40, 100, every_point, kinds))[:k]
+        assert clustered.nearest(-40, 100, k, kinds) == expected, \
+            'spatial index: nearest(-40, 100, %d, %r) differs from a brute force search' % (k, kinds)
+
+    # an export's index holds the parcels and structures with coordinates
+    DFRP_Generate.generate(os.path.join(directory, 'dfrp-rbif.xml'), 200, 2)
+    export(directory, spatial_index=True)
+    saved = DFRP_XML.SpatialIndex.load(os.path.join(directory, 'spatial_index.json'))
+    expected = []
+    for kind, (latitude_column, longitude_column) in DFRP_XML.SpatialIndexOutput.location_columns.items():
+        header, rows = read_table(directory, kind)
+        table = DFRP_XML.tables[kind]
+        for row in rows:
+            if row[header.index(latitude_column)] != '' and row[header.index(longitude_column)] != '':
+                expected.append((kind, tuple(table.key(row))))
+    assert sorted((kind, key) for _, _, kind, key in saved.points) == sorted(expected), \
+        'spatial index: the exported index does not hold every parcel and structure location'
+    print('spatial index: bbox and nearest match a brute force search')
+
+
+# function to check that the output tables in two directories are identical
+def same_tables(directory, other_directory):
+    for table_name in DFRP_XML.table_names:
+        with open(os.path.join(directory, table_name + '.csv'), 'rb') as table_file:
+            with open(os.path.join(other_directory, table_name + '.csv'), 'rb') as other_file:
+                if table_file.read() != other_file.read():
+                    return False
+    return True
+
+
+# function to return the cache keys of the Properties in an XML dump, the hashes of their XML as in ParseCache.key()
+def property_keys(path):
+    with open(path, 'rb') as xml_file:
+        return [hashlib.sha1(Property).hexdigest() for Property in DFRP_XML.split_properties(xml_file)]
+
+
+# function to check the parse cache: the output of cached runs matches an uncached export, a run on an unchanged dump
+# is skipped unless its output is missing, only new or changed Properties are converted, and the least recently used
+# Properties are evicted beyond cache_size
+def check_cache(directory):
+    xml_path = os.path.join(directory, 'dfrp-rbif.xml')
+    cache_path = os.path.join(directory, 'cache.sqlite')
+    output = os.path.join(directory, 'cached') + os.sep
+    reference = os.path.join(directory, 'reference') + os.sep
+    os.mkdir(output)
+    os.mkdir(reference)
+    DFRP_Generate.generate(xml_path, 100, 3)
+
+    # count the Properties converted, which are the ones missing from the cache
+    conversions = []
+    convert_isolated = DFRP_XML.convert_isolated
+
+    def counted_convert_isolated(Property):
+        conversions.append(Property)
+        return convert_isolated(Property)
+
+    def cached_export(**settings):
+        del conversions[:]
+        settings.setdefault('input_path', xml_path)
+        export(output, cache_path=cache_path, **settings)
+        return len(conversions)
+
+    DFRP_XML.convert_isolated = counted_convert_isolated
+    try:
+        export(reference, input_path=xml_path)
+        assert cached_export() == 100, 'cache: first run did not convert every Property'
+        assert same_tables(output, reference), 'cache: cached output differs from an uncached export'
+
+        # an unchanged dump is skipped, leaving the output alone, unless some of the output is missing
+        with open(os.path.join(output, 'tenant.csv'), 'wb') as table_file:
+            table_file.write(b'left alone')
+        assert cached_export() == 0, 'cache: run on an unchanged dump converted Properties'
+        with open(os.path.join(output, 'tenant.csv'), 'rb') as table_file:
+            assert table_file.read() == b'left alone', 'cache: run on an unchanged dump was not skipped'
+        os.remove(os.path.join(output, 'property.csv'))
+        assert cached_export() == 0, 'cache: cached Properties were converted again'
+        assert same_tables(output, reference), 'cache: output from cached Properties differs from an uncached export'
+
+        # only the changed Property is converted
+        change_dump(directory, u'00010', u'00020')
+        export(reference, input_path=xml_path)
+        assert cached_export() == 1, 'cache: unchanged Properties were converted again'
+        assert same_tables(output, reference), 'cache: output with a changed Property differs from an uncached export'
+
+        # the Properties used by the last run are the ones kept when the cache is full
+        subset_path = os.path.join(directory, 'subset.xml')
+        DFRP_Generate.generate(subset_path, 5, 3)
+        assert cached_export(input_path=subset_path, cache_size=5) == 0, \
+            'cache: Properties cached by an earlier run were converted again'
+        connection = sqlite3.connect(cache_path)
+        try:
+            kept = set(row[0] for row in connection.execute('SELECT hash FROM property'))
+        finally:
+            connection.close()
+        assert kept == set(property_keys(subset_path)), 'cache: the least recently used Properties were not evicted'
+        missing = len([key for key in property_keys(xml_path) if key not in kept])
+        assert cached_export(cache_size=5) == missing, 'cache: evicted Properties were not converted again'
+        assert same_tables(output, reference), 'cache: output after evictions differs from an uncached export'
+    finally:
+        DFRP_XML.convert_isolated = convert_isolated
+    print('cache: hits, misses, skipped runs and evictions are correct')
+
+
+if __name__ == '__main__':
+    for check in [check_delta, check_spatial_index, check_cache]:
+        directory = tempfile.mkdtemp(prefix='dfrp-check-')
+        try:
+            check(directory + os.sep)
+        finally:
+            shutil.rmtree(directory)
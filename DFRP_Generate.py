@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+# Directory of Federal Real Property (DFRP) synthetic XML dump generator
+# Tested with Python 2.7.10
+
+# Output: an XML dump with the element structure described in dfrp-rbif-eng.rtf, as read by DFRP_XML.py, filled with
+#         random values; used to benchmark and test the exporter at sizes the real dump has not reached yet
+# Usage: python DFRP_Generate.py <output XML path> <number of Properties> [random seed]
+#        The same number of Properties and seed always generate the same file on the same version of Python
+
+# License: CC-BY-SA (see https://creativecommons.org/licenses/by-sa/4.0/legalcode)
+
+
+import io
+import random
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+
+# provinces and territories, with a typical latitude and longitude to scatter locations around, and a few municipalities
+provinces = [
+    (u'Newfoundland and Labrador', u'Terre-Neuve-et-Labrador', 48.5, -56.0, [u"St. John's", u'Gander']),
+    (u'Prince Edward Island', u'Île-du-Prince-Édouard', 46.3, -63.3, [u'Charlottetown', u'Summerside']),
+    (u'Nova Scotia', u'Nouvelle-Écosse', 45.0, -63.5, [u'Halifax', u'Sydney', u'Truro']),
+    (u'New Brunswick', u'Nouveau-Brunswick', 46.5, -66.0, [u'Fredericton', u'Moncton', u'Saint John']),
+    (u'Quebec', u'Québec', 47.0, -71.5, [u'Montréal', u'Québec', u'Gatineau', u'Sherbrooke']),
+    (u'Ontario', u'Ontario', 45.5, -79.0, [u'Ottawa', u'Toronto', u'Kingston', u'Thunder Bay']),
+    (u'Manitoba', u'Manitoba', 50.5, -97.5, [u'Winnipeg', u'Brandon']),
+    (u'Saskatchewan', u'Saskatchewan', 51.5, -106.0, [u'Regina', u'Saskatoon']),
+    (u'Alberta', u'Alberta', 52.5, -114.0, [u'Calgary', u'Edmonton', u'Jasper']),
+    (u'British Columbia', u'Colombie-Britannique', 50.0, -122.5, [u'Vancouver', u'Victoria', u'Prince Rupert']),
+    (u'Yukon', u'Yukon', 61.5, -135.0, [u'Whitehorse', u'Dawson']),
+    (u'Northwest Territories', u'Territoires du Nord-Ouest', 62.5, -114.5, [u'Yellowknife', u'Inuvik']),
+    (u'Nunavut', u'Nunavut', 64.0, -85.0, [u'Iqaluit', u'Rankin Inlet'])]
+
+# foreign locations: country code, English and French country name, English and French city name
+foreign_locations = [
+    (u'US', u'United States', u'États-Unis', u'Washington, DC', u'Washington (DC)'),
+    (u'FR', u'France', u'France', u'Paris', u'Paris'),
+    (u'GB', u'United Kingdom', u'Royaume-Uni', u'London', u'Londres'),
+    (u'JP', u'Japan', u'Japon', u'Tokyo', u'Tokyo'),
+    (u'BR', u'Brazil', u'Brésil', u'Brasilia', u'Brasilia')]
+
+# code, English and French name
+primary_uses = [
+    (u'01', u'Office', u'Bureau'),
+    (u'02', u'Housing', u'Logement'),
+    (u'03', u'Laboratory', u'Laboratoire'),
+    (u'04', u'Navigation', u'Navigation'),
+    (u'05', u'Park', u'Parc'),
+    (u'06', u'Military', u'Militaire')]
+interest_types = [
+    (u'01', u'Crown-Owned', u'Propriété de la Couronne'),
+    (u'02', u'Lease/License', u'Bail/Permis'),
+    (u'03', u'Lease-Purchase', u'Location-achat')]
+restrictions = [
+    (u'01', u'None', u'Aucune'),
+    (u'02', u'Reversionary Clause', u'Clause de réversion'),
+    (u'03', u'Heritage Designation', u'Désignation patrimoniale')]
+conditions = [
+    (u'1', u'Good', u'Bon'),
+    (u'2', u'Fair', u'Passable'),
+    (u'3', u'Poor', u'Mauvais')]
+use_types = [
+    (u'01', u'Office', u'Bureau'),
+    (u'02', u'Storage', u'Entreposage'),
+    (u'03', u'Residential', u'Résidentiel'),
+    (u'04', u'Laboratory', u'Laboratoire'),
+    (u'05', u'Workshop', u'Atelier'),
+    (u'06', u'Bridge', u'Pont')]
+
+custodian_count = 80
+
+
+# function to return a bilingual pair of elements, TAG_E and TAG_F, with an optional code attribute
+def bilingual(tag, english, french, code=None):
+    attributes = u' code=%s' % quoteattr(code) if code is not None else u''
+    return u'<%s_E%s>%s</%s_E><%s_F%s>%s</%s_F>' % (tag, attributes, escape(english), tag, tag, attributes,
+                                                     escape(french), tag)
+
+
+# function to return a simple element
+def element(tag, text, attributes=u''):
+    return u'<%s%s>%s</%s>' % (tag, attributes, escape(text), tag)
+
+
+# function to return a date and time attribute value
+def timestamp(generator, first_year, last_year):
+    return u'%04d-%02d-%02dT%02d:%02d:%02d' % (generator.randint(first_year, last_year), generator.randint(1, 12),
+                                              generator.randint(1, 28), generator.randint(0, 23),
+                                              generator.randint(0, 59), generator.randint(0, 59))
+
+
+# function to return a Custodian element; each code always gets the same metadata, as in the real dump
+def custodian(code):
+    generator = random.Random(code)
+    kind = generator.choice([u'isDepartment', u'isAgency', u'isCrownCorporation'])
+    attributes = u' code=%s %s="true"' % (quoteattr(u'%03d' % code), kind)
+    if generator.random() < 0.9:
+        attributes += u' portfolioLastCertifiedDate="%04d-%02d-%02d"' % (generator.randint(2012, 2018),
+                                                                      generator.randint(1, 12),
+                                                                      generator.randint(1, 28))
+    parts = [u'<Custodian%s>' % attributes, bilingual(u'Name', u'Department of Example Affairs %d' % code,
+                                                      u"Ministère des Affaires d'exemple %d" % code)]
+    if generator.random() < 0.6:
+        parts.append(element(u'Official_Contact_Name', u'Contact %d' % code))
+        parts.append(element(u'Official_Contact_Telephone', u'613-555-%04d' % code))
+        parts.append(element(u'Official_Contact_Email', u'contact%d@example.gc.ca' % code))
+    else:
+        parts.append(element(u'Official_Contact_Telephone', u'1-800-555-%04d' % code))
+        parts.append(element(u'Official_Contact_Webform', u'https://example.gc.ca/contact/%d' % code))
+    parts.append(u'</Custodian>')
+    return u''.join(parts)
+
+
+# function to return a Location element for a parcel, and its latitude and longitude (None for foreign locations)
+def parcel_location(generator):
+    if generator.random() < 0.97:
+        province = generator.choice(provinces)
+        municipality = generator.choice(province[4])
+        latitude = province[2] + generator.uniform(-2, 2)
+        longitude = province[3] + generator.uniform(-3, 3)
+        area = generator.choice([u'inUrbanArea', u'inRuralArea', u'inIsolatedArea'])
+        parts = [u'<Location type="canadian" sgc="%07d" fed="%05d" %s="true">' % (
+                     generator.randint(1000000, 6299999), generator.randint(10000, 62999), area),
+                 bilingual(u'Province', province[0], province[1])]
+        if generator.random() < 0.6:
+            parts.append(bilingual(u'Metro_Area_Name', municipality, municipality))
+        parts.append(bilingual(u'Municipality', municipality, municipality))
+        if generator.random() < 0.3:
+            parts.append(element(u'Place_Name', u'Place %d' % generator.randint(1, 999)))
+        parts.append(bilingual(u'Federal_Electoral_District', municipality + u' Centre', municipality + u'-Centre'))
+        parts.append(element(u'Latitude', u'%.6f' % latitude))
+        parts.append(element(u'Longitude', u'%.6f' % longitude))
+        parts.append(element(u'Positional_Accuracy', u'%d' % generator.randint(1, 1000), u' unitofMeasure="m"'))
+        parts.append(bilingual(u'Country_Name', u'Canada', u'Canada', u'CA'))
+        parts.append(u'</Location>')
+        return u''.join(parts), latitude, longitude
+    country = generator.choice(foreign_locations)
+    location = u'<Location type="foreign">%s%s</Location>' % (
+        bilingual(u'Country_Name', country[1], country[2], country[0]), bilingual(u'City_Name', country[3], country[4]))
+    return location, None, None
+
+
+# function to return a Photos element with one to three photos
+def photos(generator, name):
+    parts = [u'<Photos>']
+    for number in range(generator.randint(1, 3)):
+        attributes = u' primary="true"' if number == 0 else u''
+        parts.append(element(u'Photo', u'https://example.gc.ca/photos/%s-%d.jpg' % (name, number), attributes))
+    parts.append(u'</Photos>')
+    return u''.join(parts)
+
+
+# function to return a Structure element located near the parcel's latitude and longitude
+def structure(generator, number, latitude, longitude):
+    created = timestamp(generator, 2000, 2012)
+    parts = [u'<Structure occupancy="%s" createdDate="%s" lastModifiedDate="%s">' % (
+                 generator.choice([u'complete', u'partial']), created, timestamp(generator, 2013, 2018)),
+             element(u'Structure_Number', u'%08d' % number),
+             custodian(generator.randint(1, custodian_count)),
+             bilingual(u'Structure_Name', u'Building %d' % number, u'Édifice %d' % number)]
+    if generator.random() < 0.5:
+        parts.append(bilingual(u'Address', u'%d Example Street' % generator.randint(1, 9999),
+                               u"%d rue de l'Exemple" % generator.randint(1, 9999)))
+    if latitude is not None and generator.random() < 0.8:
+        parts.append(u'<Location type="canadian">%s%s</Location>' % (
+            element(u'Latitude', u'%.6f' % (latitude + generator.uniform(-0.01, 0.01))),
+            element(u'Longitude', u'%.6f' % (longitude + generator.uniform(-0.01, 0.01)))))
+    interest = generator.choice(interest_types)
+    parts.append(bilingual(u'Interest_Type', interest[1], interest[2], interest[0]))
+    if generator.random() < 0.8:
+        condition = generator.choice(conditions)
+        parts.append(bilingual(u'Condition', condition[1], condition[2], condition[0]))
+    parts.append(element(u'Floor_Area', u'%.2f' % generator.uniform(10, 50000), u' unitofMeasure="sqm"'))
+    if latitude is not None:
+        parts.append(element(u'MiniMap', u'https://example.gc.ca/minimap/s%d.png' % number))
+    parts.append(u'<UseTypes>')
+    for use_type in generator.sample(use_types, generator.randint(1, 3)):
+        parts.append(u'<UseType code=%s>%s</UseType>' % (quoteattr(use_type[0]),
+                                                         bilingual(u'Use_Name', use_type[1], use_type[2])))
+    parts.append(u'</UseTypes>')
+    if generator.random() < 0.2:
+        parts.append(u'<Tenants>')
+        for tenant in generator.sample(range(1, custodian_count + 1), generator.randint(1, 3)):
+            parts.append(u'<Tenant code="%03d">%s%s</Tenant>' % (
+                tenant, bilingual(u'Name', u'Department of Example Affairs %d' % tenant,
+                                  u"Ministère des Affaires d'exemple %d" % tenant),
+                element(u'Floor_Area', u'%.2f' % generator.uniform(10, 5000), u' unitofMeasure="sqm"')))
+        parts.append(u'</Tenants>')
+    if generator.random() < 0.3:
+        parts.append(photos(generator, u's%d' % number))
+    parts.append(u'</Structure>')
+    return u''.join(parts)
+
+
+# function to write a synthetic dump of the given number of Properties to path
+def generate(path, property_count, seed=0):
+    generator = random.Random(seed)
+    structure_number = 0
+    with io.open(path, 'w', encoding='utf-8', newline='\n') as xml_file:
+        xml_file.write(u'<?xml version="1.0" encoding="utf-8"?>\n<DirectoryOfFederalRealProperty>\n')
+        for property_number in range(property_count):
+            created = timestamp(generator, 1990, 2010)
+            parts = [u'<Property lastModifiedDate="%s" createdDate="%s">' % (timestamp(generator, 2011, 2018), created),
+                     element(u'Property_Number', u'%05d' % property_number)]
+            if generator.random() < 0.8:
+                parts.append(bilingual(u'Property_Name', u'Example Property %d' % property_number,
+                                       u'Propriété exemple %d' % property_number))
+            if generator.random() < 0.7:
+                parts.append(bilingual(u'Address', u'%d Example Road' % generator.randint(1, 9999),
+                                       u"%d chemin de l'Exemple" % generator.randint(1, 9999)))
+            for tag, values in [(u'Primary_Use', primary_uses), (u'Interest_Type', interest_types),
+                                (u'Restriction_on_Interest', restrictions)]:
+                value = generator.choice(values)
+                parts.append(bilingual(tag, value[1], value[2], value[0]))
+            parts.append(custodian(generator.randint(1, custodian_count)))
+
+            # parcel 00 is the whole property, and a parcelled property adds 01, 02, etc.
+            parts.append(u'<Parcels>')
+            parcel_count = 1 if generator.random() < 0.85 else generator.randint(3, 5)
+            for parcel_number in range(parcel_count):
+                location, latitude, longitude = parcel_location(generator)
+                structure_count = generator.choice([0, 0, 0, 1, 1, 2, 3, 5])
+                parts.append(u'<Parcel number="%02d">' % parcel_number)
+                parts.append(element(u'Land_Area', u'%.4f' % generator.uniform(0.01, 1000), u' unitofMeasure="ha"'))
+                parts.append(element(u'Building_Count', u'%d' % structure_count))
+                parts.append(element(u'Floor_Area', u'%.2f' % generator.uniform(0, 100000), u' unitofMeasure="sqm"'))
+                if generator.random() < 0.2:
+                    parts.append(u'<ParkingSpaces>%s%s</ParkingSpaces>' % (
+                        element(u'Exterior', u'%d' % generator.randint(0, 500)),
+                        element(u'Interior', u'%d' % generator.randint(0, 200),
+                                u' includedInFloorArea="%s"' % generator.choice([u'true', u'false']))))
+                parts.append(location)
+                if structure_count > 0:
+                    parts.append(u'<Structures>')
+                    for _ in range(structure_count):
+                        structure_number += 1
+                        parts.append(structure(generator, structure_number, latitude, longitude))
+                    parts.append(u'</Structures>')
+                parts.append(u'</Parcel>')
+            parts.append(u'</Parcels>')
+
+            if generator.random() < 0.7:
+                parts.append(element(u'MiniMap', u'https://example.gc.ca/minimap/p%d.png' % property_number))
+            if generator.random() < 0.2:
+                parts.append(photos(generator, u'p%d' % property_number))
+            if generator.random() < 0.05:
+                parts.append(u'<FederalContaminatedSites>')
+                for _ in range(generator.randint(1, 3)):
+                    parts.append(u'<Site FederalSiteIdentifier="%08d"/>' % generator.randint(0, 99999999))
+                parts.append(u'</FederalContaminatedSites>')
+            parts.append(u'</Property>\n')
+            xml_file.write(u''.join(parts))
+        xml_file.write(u'</DirectoryOfFederalRealProperty>\n')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (3, 4):
+        sys.exit('Usage: python DFRP_Generate.py <output XML path> <number of Properties> [random seed]')
+    generate(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) == 4 else 0)
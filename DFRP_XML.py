@@ -5,8 +5,13 @@
 # Input: XML dump of real property, described at https://www.tbs-sct.gc.ca/dfrp-rbif/home-accueil-eng.aspx and
 #        downloaded from https://www.tbs-sct.gc.ca/dfrp-rbif/opendata-eng.aspx
 # Output: CSV tables that can be imported into a relational database system or GIS software
+# Usage: python DFRP_XML.py [options] [input]; run with --help for the options, which override the settings below
+#        As a module: read_records() yields a typed Property record, with its parcels, structures and tenants, as each
+#        Property is parsed; export() runs the export set up with configure(), and export_records() writes records to
+#        a Sink such as CsvOutput
 # Note: Exports UTF-8 encoding; non-ASCII characters will display incorrectly in Excel, which assumes UTF-16
-#       To output French text, search and replace '_E' with '_F'; you may also want to translate field names
+#       To output French text, set languages to ['F'], or to ['E', 'F'] for both; you may also want to translate field
+#       names
 #       You may wish to force Property_Number, Parcel_number, Structure_Number, FederalSiteIdentifier to a string when
 #       importing:
 #           In Excel, do this by customizing the CSV import specification
@@ -15,360 +20,1863 @@
 # License: CC-BY-SA (see https://creativecommons.org/licenses/by-sa/4.0/legalcode)
 
 
+import argparse
+import bz2
+import collections
+import gzip
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import sys
+import time
 import xml.etree.ElementTree as ET
+import zlib
 import unicodecsv as csv
 
+# optional, for Parquet output
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# optional, for .xz input and output (in the standard library from Python 3.3)
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# optional, for .zst input and output
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 # replace with appropriate local path
 starting_path = 'C:/GIS/DFRP/'
 
+# XML dump to read: a path, '-' for standard input, or a file object (None reads dfrp-rbif.xml in starting_path); gzip,
+# bzip2, xz and zstandard compressed input is recognized from its first bytes and decompressed as it is read
+input_path = None
+
+# CSV output tables to write to '-' for standard output, or to a file object, instead of <table>.csv in starting_path,
+# keyed by table name (None to write every table to its file)
+output_files = None
+
+# compression of the CSV files written to starting_path: None, 'gzip', 'bz2', 'xz' or 'zstd' (which add .gz, .bz2, .xz
+# or .zst to the file names), and the size of the buffer that collects their rows before each write
+output_compression = None
+buffer_size = 1 << 20
+
+# parse the XML incrementally, one Property at a time, instead of loading the whole tree into memory
+streaming = True
+
+# number of worker processes used to convert Properties to rows (1 converts them in the main process), and the number
+# of Properties handed to a worker at a time
+processes = 1
+chunk_size = 100
+
+# custodian lookup table saved between runs, so repeat runs start from the previous run's custodians instead of
+# rebuilding them (None to rebuild it every run), and whether to report custodians whose metadata differs between
+# records with the same code
+custodian_registry_path = None
+check_custodian_conflicts = False
+
+# output format: 'csv' for a CSV file per table, 'sqlite' for a single SQLite database, dfrp-rbif.sqlite, loaded in
+# transactions of batch_size rows, or 'parquet' for a Parquet file per table (requires pyarrow), written in row groups
+# of batch_size rows
+output_format = 'csv'
+batch_size = 10000
+
+# build a spatial index of parcel and structure locations, spatial_index.json, for bounding box and nearest neighbour
+# queries with SpatialIndex.load()
+spatial_index = False
+
+# incremental export: state file of the record keys and modification dates exported by the previous run; when set,
+# only the rows inserted, updated or deleted since then are written, to <table>_delta.csv files with a change column
+# (None exports the full tables)
+delta_state_path = None
+
+# parse cache: SQLite file of the rows converted by earlier runs, keyed by a hash of each serialized Property, so that
+# unchanged Properties are not converted again, and of the whole input file, so that an identical file is not exported
+# again (None converts everything every run); cache_size bounds the number of Properties kept, evicting the least
+# recently used
+cache_path = None
+cache_size = 500000
+
+# instrumentation: print progress (Properties/sec, MB read and estimated time remaining) to stderr every
+# progress_interval seconds, followed by the time spent in each stage of the run and the rows written to each output
+# table (None for no progress), and write the same measurements to metrics_path as JSON (None for no metrics file)
+progress_interval = None
+metrics_path = None
 
-# function to check for optional element, with optional sub-element and sub-sub-element, and return element text
-# check for both the "doesn't exist" case and the "empty element" case (although it appears the data only has latter)
-def optional_element_lookup(parent_element, element_name, sub_element_name=None, sub_sub_element_name=None):
-    ret = ''
-    element = parent_element.find(element_name)
-    if element is not None:
-        if sub_element_name is not None:
-            sub_element = element.find(sub_element_name)
-            if sub_element is not None:
-                if sub_sub_element_name is not None:
-                    sub_sub_element = sub_element.find(sub_sub_element_name)
-                    if sub_sub_element is not None:
-                        if sub_sub_element.text is not None:
-                            ret = sub_sub_element.text
+# languages of the bilingual text columns: 'E' for English, 'F' for French; with more than one, both are read in the
+# same pass and each bilingual column is exported once per language, with the language appended to its name
+# (Property_Name_E, Property_Name_F)
+languages = ['E']
+
+# output table schema
+# each table's rows are built from the elements at path under its parent table's element ('container/item', where an
+# item of '*' takes every child of the container), and start with the key columns inherited from the parent tables;
+# key names the column identifying a row among its parent's rows, which is passed on to child tables, and tables with
+# custodian set have their Custodian element added to the custodian lookup table
+# each column is read from path under the row's element: '/'-separated child element names ('' for the row's element
+# itself), optionally followed by '@attribute'; missing elements and attributes export as '', unless the column is
+# required, in which case a missing element is an error
+# separator joins the text of a sub-element of every child of the element at path ('UseTypes/*/Use_Name'), and
+# if_text only exports the attribute if the element has text
+# type is the column's value type in typed outputs ('text', 'integer' or 'real'); values are always exported as text
+# bilingual columns are read from the element at path with the language appended ('Property_Name' reads
+# Property_Name_E and Property_Name_F)
+Table = collections.namedtuple('Table', ['name', 'parent', 'path', 'key', 'custodian', 'columns'])
+Column = collections.namedtuple('Column', ['name', 'path', 'type', 'required', 'separator', 'if_text', 'bilingual'])
+
+
+def column(name, path, type='text', required=False, separator=None, if_text=False, bilingual=False):
+    return Column(name, path, type, required, separator, if_text, bilingual)
+
+
+# function to expand the bilingual columns of a table into a column per language
+def language_columns(columns, languages):
+    expanded = []
+    for column in columns:
+        if not column.bilingual:
+            expanded.append(column)
+            continue
+        path, separator, attribute = column.path.partition('@')
+        for language in languages:
+            name = column.name if len(languages) == 1 else column.name + '_' + language
+            expanded.append(column._replace(name=name, path=path + '_' + language + separator + attribute))
+    return expanded
+
+
+schema = [
+    Table('custodian', None, None, 'code', False, [
+        column('code', '@code'),
+        column('isDepartment', '@isDepartment'),
+        column('isAgency', '@isAgency'),
+        column('isCrownCorporation', '@isCrownCorporation'),
+        column('portfolioLastCertifiedDate', '@portfolioLastCertifiedDate'),
+        column('Name', 'Name', bilingual=True, required=True),
+        column('Official_Contact_Name', 'Official_Contact_Name'),
+        column('Official_Contact_Telephone', 'Official_Contact_Telephone'),
+        column('Official_Contact_Email', 'Official_Contact_Email'),
+        column('Official_Contact_WebForm', 'Official_Contact_Webform')]),
+    Table('property', None, 'Property', 'Property_Number', True, [
+        column('lastModifiedDate', '@lastModifiedDate'),
+        column('createdDate', '@createdDate'),
+        column('Property_Number', 'Property_Number', required=True),
+        column('Custodian_code', 'Custodian@code', required=True),
+        column('Property_Name', 'Property_Name', bilingual=True),
+        column('Address', 'Address', bilingual=True),
+        column('Primary_Use', 'Primary_Use', bilingual=True, required=True),
+        column('Interest_Type', 'Interest_Type', bilingual=True, required=True),
+        column('Restriction_on_Interest', 'Restriction_on_Interest', bilingual=True, required=True),
+        column('MiniMap', 'MiniMap')]),
+    Table('parcel', 'property', 'Parcels/Parcel', 'Parcel_number', False, [
+        column('Parcel_number', '@number'),
+        column('Land_Area', 'Land_Area', 'real', required=True),
+        column('Land_Area_unitofMeasure', 'Land_Area@unitofMeasure', required=True),
+        column('Building_Count', 'Building_Count', 'integer', required=True),
+        column('Floor_Area', 'Floor_Area', 'real', required=True),
+        # earlier versions exported the land area unit here, and downstream imports expect it
+        column('Floor_Area_unitofMeasure', 'Land_Area@unitofMeasure', required=True),
+        column('ExteriorParkingSpaces', 'ParkingSpaces/Exterior', 'integer'),
+        column('InteriorParkingSpaces', 'ParkingSpaces/Interior', 'integer'),
+        column('InteriorParkingSpaces_includedInFloorArea', 'ParkingSpaces/Interior@includedInFloorArea',
+               if_text=True),
+        column('Location_type', 'Location@type', required=True),
+        column('Location_sgc', 'Location@sgc', required=True),
+        column('Location_fed', 'Location@fed', required=True),
+        column('Location_inUrbanArea', 'Location@inUrbanArea', required=True),
+        column('Location_inRuralArea', 'Location@inRuralArea', required=True),
+        column('Location_inIsolatedArea', 'Location@inIsolatedArea', required=True),
+        column('Location_Province', 'Location/Province', bilingual=True),
+        column('Location_Metro_Area_Name', 'Location/Metro_Area_Name', bilingual=True),
+        column('Location_Municipality', 'Location/Municipality', bilingual=True),
+        column('Location_Place_Name', 'Location/Place_Name'),
+        column('Location_Federal_Electoral_District', 'Location/Federal_Electoral_District', bilingual=True),
+        column('Location_Latitude', 'Location/Latitude', 'real'),
+        column('Location_Longitude', 'Location/Longitude', 'real'),
+        column('Location_PositionalAccuracy', 'Location/Positional_Accuracy', 'real'),
+        column('Location_PositionalAccuracy_unitofMeasure', 'Location/Positional_Accuracy@unitofMeasure'),
+        column('Location_Country_Name', 'Location/Country_Name', bilingual=True),
+        column('Location_City_Name', 'Location/City_Name', bilingual=True)]),
+    Table('structure', 'parcel', 'Structures/Structure', 'Structure_Number', True, [
+        column('Structure_Number', 'Structure_Number', required=True),
+        column('occupancy', '@occupancy'),
+        column('createdDate', '@createdDate'),
+        column('lastModifiedDate', '@lastModifiedDate'),
+        column('Custodian_code', 'Custodian@code', required=True),
+        column('Structure_Name', 'Structure_Name', bilingual=True, required=True),
+        column('Address', 'Address', bilingual=True),
+        column('Latitude', 'Location/Latitude', 'real'),
+        column('Longitude', 'Location/Longitude', 'real'),
+        column('Interest_Type', 'Interest_Type', bilingual=True, required=True),
+        column('Condition', 'Condition', bilingual=True),
+        column('Floor_Area', 'Floor_Area', 'real', required=True),
+        column('Floor_Area_unitofMeasure', 'Floor_Area@unitofMeasure', required=True),
+        column('MiniMap', 'MiniMap'),
+        column('UseTypes', 'UseTypes/*/Use_Name', bilingual=True, required=True, separator=' | ')]),
+    Table('structure_photo', 'structure', 'Photos/*', 'Photo', False, [
+        column('Photo', '')]),
+    Table('tenant', 'structure', 'Tenants/*', 'code', False, [
+        column('code', '@code'),
+        column('Name', 'Name', bilingual=True, required=True),
+        column('Floor_Area', 'Floor_Area', 'real', required=True),
+        column('Floor_Area_unitofMeasure', 'Floor_Area@unitofMeasure', required=True)]),
+    Table('federal_contaminated_site', 'property', 'FederalContaminatedSites/Site', 'FederalSiteID', False, [
+        column('FederalSiteID', '@FederalSiteIdentifier')]),
+    Table('property_photo', 'property', 'Photos/*', 'Photo', False, [
+        column('Photo', '')])]
+
+
+# compiled extractor for the columns read from one element and its descendants
+# the element's children are scanned once per row, keeping the first child with each tag, like find(); children
+# without columns of their own below them are read in the same pass, without a further call
+class ElementExtractor(object):
+    __slots__ = ['required', 'text', 'attributes', 'joins', 'children', 'required_tags']
+
+    def __init__(self):
+        self.required = False
+        self.text = []
+        self.attributes = []
+        self.joins = []
+        self.children = {}
+        self.required_tags = []
+
+    def child(self, tag, required=False):
+        if tag not in self.children:
+            self.children[tag] = ElementExtractor()
+        extractor = self.children[tag]
+        if required and not extractor.required:
+            extractor.required = True
+            self.required_tags.append(tag)
+        return extractor
+
+    # fill the compiled columns of row from element, and return its children found by tag
+    def extract(self, element, row):
+        text = element.text or ''
+        for index in self.text:
+            row[index] = text
+        for index, attribute, if_text in self.attributes:
+            if not if_text or text:
+                row[index] = element.get(attribute) or ''
+        for index, tag, separator, required in self.joins:
+            values = []
+            for child in element:
+                sub_element = child.find(tag)
+                if sub_element is None:
+                    if required:
+                        raise ValueError('%s element is missing required %s element' % (child.tag, tag))
                 else:
-                    if sub_element.text is not None:
-                        ret = sub_element.text
-        else:
-            if element.text is not None:
-                ret = element.text
-    return ret
+                    values.append(sub_element.text or '')
+            row[index] = separator.join(values)
+        found = {}
+        children = self.children
+        if len(children) > 0:
+            for child in element:
+                tag = child.tag
+                extractor = children.get(tag)
+                if extractor is not None and tag not in found:
+                    found[tag] = child
+                    if extractor.joins or extractor.children:
+                        extractor.extract(child, row)
+                    else:
+                        text = child.text or ''
+                        for index in extractor.text:
+                            row[index] = text
+                        for index, attribute, if_text in extractor.attributes:
+                            if not if_text or text:
+                                row[index] = child.get(attribute) or ''
+            for tag in self.required_tags:
+                if tag not in found:
+                    raise ValueError('%s element is missing required %s element' % (element.tag, tag))
+        return found
+
+
+# compiled table, built from its Table schema by compile_schema
+class TableExtractor(object):
+    def __init__(self, table, parent, languages):
+        self.name = table.name
+        self.parent = parent
+        self.custodian = table.custodian
+        self.child_tables = []
+        self.key_names = []
+        self.container = None
+        self.item = None
+        if parent is not None:
+            self.key_names.extend(parent.key_names)
+            self.container, self.item = table.path.split('/')
+            parent.child_tables.append(self)
+            parent.root.child(self.container)
+        columns = language_columns(table.columns, languages)
+        self.header = self.key_names + [column.name for column in columns]
+        self.types = ['text'] * len(self.key_names) + [column.type for column in columns]
+        self.bilingual = [False] * len(self.key_names) + [column.bilingual for column in columns]
+        self.key_index = None
+        if table.key is not None:
+            self.key_index = self.header.index(table.key, len(self.key_names))
+            self.key_names = self.key_names + [table.key]
+
+        # group the columns by element path, so that each element is only looked up once
+        self.root = ElementExtractor()
+        if table.custodian:
+            self.root.child('Custodian')
+        for index, column in enumerate(columns, len(self.header) - len(columns)):
+            path, _, attribute = column.path.partition('@')
+            steps = path.split('/') if len(path) > 0 else []
+            if column.separator is not None:
+                steps, join_tag = steps[:-2], steps[-1]
+            extractor = self.root
+            for step in steps:
+                extractor = extractor.child(step, column.required)
+            if column.separator is not None:
+                extractor.joins.append((index, join_tag, column.separator, column.required))
+            elif len(attribute) > 0:
+                extractor.attributes.append((index, attribute, column.if_text))
+            else:
+                extractor.text.append(index)
+
+    # return the table row for element, starting with the parent tables' key values, and the element's children
+    def extract(self, element, keys):
+        row = keys + [''] * (len(self.header) - len(keys))
+        found = self.root.extract(element, row)
+        return row, found
+
+    # return the key values identifying a row, which are also the key values passed on to its child table rows
+    def key(self, row):
+        return row[:len(self.key_names) - 1] + [row[self.key_index]]
+
+    # return a row with only the key columns filled in
+    def key_row(self, key):
+        row = key[:-1] + [''] * (len(self.header) - len(key) + 1)
+        row[self.key_index] = key[-1]
+        return row
+
+
+# function to compile the schema into table extractors for the given languages, keyed by table name in schema order
+def compile_schema(schema, languages):
+    tables = collections.OrderedDict()
+    for table in schema:
+        parent = tables[table.parent] if table.parent is not None else None
+        tables[table.name] = TableExtractor(table, parent, languages)
+    return tables
+
+
+tables = compile_schema(schema, languages)
+
+# output tables, keyed by table name (also the CSV file name)
+table_names = list(tables.keys())
+
+# functions to convert exported text to a value of each schema column type, for typed outputs and records
+value_converters = {'text': lambda value: value,
+                    'integer': lambda value: int(value) if value != '' else None,
+                    'real': lambda value: float(value) if value != '' else None}
+
+
+# base class of the records built by read_records(), with a subclass for each table made by compile_records()
+# a record has a typed attribute for each column of its table, named as in the header, a list of records for each child
+# table (a Property's parcels, a Parcel's structures, a Structure's tenants), and, for tables with custodian set, the
+# Custodian record of its Custodian_code; rows() returns the exported text rows it was built from
+class Record(object):
+    __slots__ = ['_row']
+    # set on each table's class: the compiled table, (name, converter) for each column, the attribute of each child
+    # table's records, and the attribute holding this table's records in the parent record
+    _table = None
+    _columns = []
+    _children = []
+    _attribute = None
+
+    def __init__(self, row):
+        self._row = row
+        for (name, converter), value in zip(self._columns, row):
+            try:
+                setattr(self, name, converter(value))
+            except ValueError:
+                raise ValueError('%s %s value %r is not a number' % (self._table.name, name, value))
+        for attribute in self._children:
+            setattr(self, attribute, [])
+        if self._table.custodian:
+            self.custodian = None
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % (name, getattr(self, name))
+                                                          for name in self._table.key_names))
+
+    # return the rows of this record and the records below it, as passed to Sink.write(), adding them to rows if given;
+    # the custodian row is repeated for each record that refers to it
+    def rows(self, rows=None):
+        if rows is None:
+            rows = dict((table_name, []) for table_name in table_names)
+        rows[self._table.name].append(self._row)
+        if self._table.custodian and self.custodian is not None:
+            rows['custodian'].append(self.custodian._row)
+        for attribute in self._children:
+            for child in getattr(self, attribute):
+                child.rows(rows)
+        return rows
+
+
+# function to make a record class for each compiled table, keyed by table name
+# classes are named after their tables (structure_photo: StructurePhoto), and a child table's records are held in the
+# plural of its name, less the parent table's name (structure_photo under structure: photos)
+def compile_records(tables):
+    attributes = {}
+    for table_name, table in tables.items():
+        if table.parent is not None:
+            attribute = table_name
+            if attribute.startswith(table.parent.name + '_'):
+                attribute = attribute[len(table.parent.name) + 1:]
+            attributes[table_name] = attribute + 's'
+    records = collections.OrderedDict()
+    for table_name, table in tables.items():
+        children = [attributes[child_table.name] for child_table in table.child_tables]
+        slots = table.header + children + (['custodian'] if table.custodian else [])
+        records[table_name] = type(str(''.join(part.capitalize() for part in table_name.split('_'))), (Record,),
+                                   {'__slots__': slots, '_table': table, '_children': children,
+                                    '_attribute': attributes.get(table_name),
+                                    '_columns': [(name, value_converters[column_type])
+                                                 for name, column_type in zip(table.header, table.types)]})
+    return records
+
+
+record_classes = compile_records(tables)
+
+# names of the settings at the top of this file, which configure() changes
+setting_names = ['starting_path', 'input_path', 'output_files', 'output_compression', 'buffer_size', 'streaming',
+                 'processes', 'chunk_size', 'custodian_registry_path', 'check_custodian_conflicts', 'output_format',
+                 'batch_size', 'spatial_index', 'delta_state_path', 'cache_path', 'cache_size', 'progress_interval',
+                 'metrics_path', 'languages']
+
+
+# function to change settings by name, for the exports and reads that follow, instead of editing them at the top of this
+# file; changing languages recompiles the schema and the record classes
+def configure(**settings):
+    global tables, record_classes
+    for name in settings:
+        if name not in setting_names:
+            raise TypeError('unknown setting %r' % name)
+    globals().update(settings)
+    if 'languages' in settings:
+        tables = compile_schema(schema, languages)
+        record_classes = compile_records(tables)
+
+
+# function to build a custodian table row from a Custodian element
+def custodian_row(custodian):
+    return tables['custodian'].extract(custodian, [])[0]
+
+
+# lookup table of unique custodians, keyed by code, holding the custodian table row first seen for each code
+# with check_conflicts, every later occurrence of a code is compared to the first, and differing values are recorded in
+# conflicts as (code, column, first value, conflicting value)
+class CustodianRegistry(object):
+    def __init__(self, check_conflicts=False):
+        self.check_conflicts = check_conflicts
+        self.rows = collections.OrderedDict()
+        self.conflicts = []
+
+    def __contains__(self, code):
+        return code in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    # add a custodian table row, returning True if the code had not been seen before
+    def add(self, row):
+        row = ['' if value is None else value for value in row]
+        code = row[0]
+        first_row = self.rows.get(code)
+        if first_row is None:
+            self.rows[code] = row
+            return True
+        if self.check_conflicts:
+            for index in range(1, len(tables['custodian'].header)):
+                self.add_conflict(code, tables['custodian'].header[index], row[index])
+        return False
+
+    # record a conflict if value differs from the first value seen for the code's column
+    def add_conflict(self, code, column, value):
+        first_value = self.rows[code][tables['custodian'].header.index(column)]
+        conflict = (code, column, first_value, value)
+        if value != first_value and conflict not in self.conflicts:
+            self.conflicts.append(conflict)
 
+    # load the custodian table saved by an earlier run
+    def load(self, path):
+        with open(path, 'rb') as registry_file:
+            reader = csv.reader(registry_file, dialect='excel', encoding='utf-8')
+            if next(reader) != tables['custodian'].header:
+                raise ValueError('custodian registry %s has different columns (saved with other languages?)' % path)
+            for row in reader:
+                self.add(row)
 
-# function to check for optional attribute, and return element text
-def optional_attribute_lookup(element, attribute):
-    ret = element.get(attribute)
-    if ret is None:
-        ret = ''
-    return ret
+    def save(self, path):
+        with open(path, 'wb') as registry_file:
+            writer = csv.writer(registry_file, dialect='excel', encoding='utf-8')
+            writer.writerow(tables['custodian'].header)
+            writer.writerows(self.rows.values())
 
 
 # function to check whether the passed custodian has already been added to the custodian lookup table, and if not add it
-def check_add_custodian(parent_element, custodian_codes, custodian_writer):
-    custodian = parent_element.find('Custodian')
+# and its row to custodian_rows
+# the custodian's attributes and elements are only read for new codes, unless the registry checks for conflicts
+def check_add_custodian(custodian, custodians, custodian_rows):
+    if metrics is not None:
+        stage = metrics.switch('custodian')
     code = custodian.get('code')
-    if code not in custodian_codes:
-        custodian_codes.append(code)
-        # optional attributes
-        isDepartment = optional_attribute_lookup(custodian, 'isDepartment')
-        isAgency = optional_attribute_lookup(custodian, 'isAgency')
-        isCrownCorporation = optional_attribute_lookup(custodian, 'isCrownCorporation')
-        portfolioLastCertifiedDate = optional_attribute_lookup(custodian, 'portfolioLastCertifiedDate')
-        # optional elements
-        Official_Contact_Name = optional_element_lookup(custodian, 'Official_Contact_Name')
-        Official_Contact_Telephone = optional_element_lookup(custodian, 'Official_Contact_Telephone')
-        Official_Contact_Email = optional_element_lookup(custodian, 'Official_Contact_Email')
-        Official_Contact_Webform = optional_element_lookup(custodian, 'Official_Contact_Webform')
-        # output
-        custodian_writer.writerow([code,
-                                   isDepartment,
-                                   isAgency,
-                                   isCrownCorporation,
-                                   portfolioLastCertifiedDate,
-                                   custodian.find('Name_E').text,
-                                   Official_Contact_Name,
-                                   Official_Contact_Telephone,
-                                   Official_Contact_Email,
-                                   Official_Contact_Webform])
+    if code not in custodians or custodians.check_conflicts:
+        row = custodian_row(custodian)
+        if custodians.add(row):
+            custodian_rows.append(row)
+    if metrics is not None:
+        metrics.switch(stage)
     return code
 
 
-# main logic
-root = ET.parse(starting_path + 'dfrp-rbif.xml').getroot()
+# compression formats recognized in the input, by their first bytes
+compression_magic = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'), (b'\x28\xb5\x2f\xfd', 'zstd')]
 
-# Properties
-try:
-    # build lookup table of unique custodian values
-    custodian_codes = []
-    custodian_file = open(starting_path + 'custodian.csv', 'wb')
-    custodian_writer = csv.writer(custodian_file, dialect='excel', encoding='utf-8')
-    # main table
-    property_file = open(starting_path + 'property.csv', 'wb')
-    property_writer = csv.writer(property_file, dialect='excel', encoding='utf-8')
-    # 1:M related tables
-    parcel_file = open(starting_path + 'parcel.csv', 'wb')
-    parcel_writer = csv.writer(parcel_file, dialect='excel', encoding='utf-8')
-    structure_file = open(starting_path + 'structure.csv', 'wb')
-    structure_writer = csv.writer(structure_file, dialect='excel', encoding='utf-8')
-    structure_photo_file = open(starting_path + 'structure_photo.csv', 'wb')
-    structure_photo_writer = csv.writer(structure_photo_file, dialect='excel', encoding='utf-8')
-    tenant_file = open(starting_path + 'tenant.csv', 'wb')
-    tenant_writer = csv.writer(tenant_file, dialect='excel', encoding='utf-8')
-    federal_contaminated_site_file = open(starting_path + 'federal_contaminated_site.csv', 'wb')
-    federal_contaminated_site_writer = csv.writer(federal_contaminated_site_file, dialect='excel', encoding='utf-8')
-    property_photo_file = open(starting_path + 'property_photo.csv', 'wb')
-    property_photo_writer = csv.writer(property_photo_file, dialect='excel', encoding='utf-8')
-
-    # column headers
-    custodian_writer.writerow(['code',
-                               'isDepartment',
-                               'isAgency',
-                               'isCrownCorporation',
-                               'portfolioLastCertifiedDate',
-                               'Name',
-                               'Official_Contact_Name',
-                               'Official_Contact_Telephone',
-                               'Official_Contact_Email',
-                               'Official_Contact_WebForm'])
-    property_writer.writerow(['lastModifiedDate',
-                              'createdDate',
-                              'Property_Number',
-                              'Custodian_code',
-                              'Property_Name',
-                              'Address',
-                              'Primary_Use',
-                              'Interest_Type',
-                              'Restriction_on_Interest',
-                              'MiniMap'])
-    parcel_writer.writerow(['Property_Number',
-                            'Parcel_number',
-                            'Land_Area',
-                            'Land_Area_unitofMeasure',
-                            'Building_Count',
-                            'Floor_Area',
-                            'Floor_Area_unitofMeasure',
-                            'ExteriorParkingSpaces',
-                            'InteriorParkingSpaces',
-                            'InteriorParkingSpaces_includedInFloorArea',
-                            'Location_type',
-                            'Location_sgc',
-                            'Location_fed',
-                            'Location_inUrbanArea',
-                            'Location_inRuralArea',
-                            'Location_inIsolatedArea',
-                            'Location_Province',
-                            'Location_Metro_Area_Name',
-                            'Location_Municipality',
-                            'Location_Place_Name',
-                            'Location_Federal_Electoral_District',
-                            'Location_Latitude',
-                            'Location_Longitude',
-                            'Location_PositionalAccuracy',
-                            'Location_PositionalAccuracy_unitofMeasure',
-                            'Location_Country_Name',
-                            'Location_City_Name'])
-    structure_writer.writerow(['Property_Number',
-                               'Parcel_number',
-                               'Structure_Number',
-                               'occupancy',
-                               'createdDate',
-                               'lastModifiedDate',
-                               'Custodian_code',
-                               'Structure_Name',
-                               'Address',
-                               'Latitude',
-                               'Longitude',
-                               'Interest_Type',
-                               'Condition',
-                               'Floor_Area',
-                               'Floor_Area_unitofMeasure',
-                               'MiniMap',
-                               'UseTypes'])
-    structure_photo_writer.writerow(['Property_Number',
-                                     'Parcel_number',
-                                     'Structure_Number',
-                                     'Photo'])
-    tenant_writer.writerow(['Property_Number',
-                            'Parcel_number',
-                            'Structure_Number',
-                            'code',
-                            'Name',
-                            'Floor_Area',
-                            'Floor_Area_unitofMeasure'])
-    federal_contaminated_site_writer.writerow(['Property_Number',
-                                               'FederalSiteID'])
-    property_photo_writer.writerow(['Property_Number',
-                                    'Photo'])
-
-    # data rows
-    for Property in root.findall('Property'):
-        # lookup table of unique custodian values
-        code = check_add_custodian(Property, custodian_codes, custodian_writer)
-
-        # Properties - main table
-        # optional elements
-        Property_Name = optional_element_lookup(Property, 'Property_Name_E')
-        Address = optional_element_lookup(Property, 'Address_E')
-        MiniMap = optional_element_lookup(Property, 'MiniMap')
-        # output
-        property_writer.writerow([Property.get('lastModifiedDate'),
-                                  Property.get('createdDate'),
-                                  Property.find('Property_Number').text,
-                                  code,
-                                  Property_Name,
-                                  Address,
-                                  Property.find('Primary_Use_E').text,
-                                  Property.find('Interest_Type_E').text,
-                                  Property.find('Restriction_on_Interest_E').text,
-                                  MiniMap])
-
-        # 1:m related tables
-        # Parcels
-        Parcels = Property.find("Parcels")
-        if Parcels is not None:
-            for Parcel in Parcels.findall("Parcel"):
-                # optional attributes and elements
-                Location = Parcel.find('Location')
-                Location_sgc = optional_attribute_lookup(Location, 'sgc')
-                Location_fed = optional_attribute_lookup(Location, 'fed')
-                Location_inUrbanArea = optional_attribute_lookup(Location, 'inUrbanArea')
-                Location_inRuralArea = optional_attribute_lookup(Location, 'inRuralArea')
-                Location_inIsolatedArea = optional_attribute_lookup(Location, 'inIsolatedArea')
-                ExteriorParkingSpaces = optional_element_lookup(Parcel, 'ParkingSpaces', 'Exterior')
-                InteriorParkingSpaces = optional_element_lookup(Parcel, 'ParkingSpaces', 'Interior')
-                InteriorParkingSpaces_includedInFloorArea = ''
-                if len(InteriorParkingSpaces) > 0:
-                    InteriorParkingSpaces_includedInFloorArea = Parcel.find('ParkingSpaces').find('Interior').get(
-                        'includedInFloorArea')
-                Location_Province = optional_element_lookup(Location, 'Province_E')
-                Location_Metro_Area_Name = optional_element_lookup(Location, 'Metro_Area_Name_E')
-                Location_Municipality = optional_element_lookup(Location, 'Municipality_E')
-                Location_Place_Name = optional_element_lookup(Location, 'Place_Name')
-                Location_Federal_Electoral_District = optional_element_lookup(Location, 'Federal_Electoral_District_E')
-                Location_Latitude = optional_element_lookup(Location, 'Latitude')
-                Location_Longitude = optional_element_lookup(Location, 'Longitude')
-                Positional_Accuracy = Location.find('Positional_Accuracy')
-                Location_Positional_Accuracy = optional_element_lookup(Location, 'Positional_Accuracy')
-                Location_Positional_Accuracy_unitofMeasure = ''
-                if Positional_Accuracy is not None:
-                    Location_Positional_Accuracy_unitofMeasure = optional_attribute_lookup(Positional_Accuracy,
-                                                                                           'unitofMeasure')
-                Location_Country_Name = optional_element_lookup(Location, 'Country_Name_E')
-                Location_City_Name = optional_element_lookup(Location, 'City_Name_E')
-
-                # output
-                parcel_writer.writerow([Property.find('Property_Number').text,
-                                        Parcel.get('number'),
-                                        Parcel.find('Land_Area').text,
-                                        Parcel.find('Land_Area').get('unitofMeasure'),
-                                        Parcel.find('Building_Count').text,
-                                        Parcel.find('Floor_Area').text,
-                                        Parcel.find('Land_Area').get('unitofMeasure'),
-                                        ExteriorParkingSpaces,
-                                        InteriorParkingSpaces,
-                                        InteriorParkingSpaces_includedInFloorArea,
-                                        Location.get('type'),
-                                        Location_sgc,
-                                        Location_fed,
-                                        Location_inUrbanArea,
-                                        Location_inRuralArea,
-                                        Location_inIsolatedArea,
-                                        Location_Province,
-                                        Location_Metro_Area_Name,
-                                        Location_Municipality,
-                                        Location_Place_Name,
-                                        Location_Federal_Electoral_District,
-                                        Location_Latitude,
-                                        Location_Longitude,
-                                        Location_Positional_Accuracy,
-                                        Location_Positional_Accuracy_unitofMeasure,
-                                        Location_Country_Name,
-                                        Location_City_Name])
-
-                # Structures
-                Structures = Parcel.find("Structures")
-                if Structures is not None:
-                    for Structure in Structures.findall("Structure"):
-                        # lookup table of unique custodian values
-                        code = check_add_custodian(Structure, custodian_codes, custodian_writer)
-
-                        # optional elements
-                        Address = optional_element_lookup(Structure, 'Address_E')
-                        Latitude = optional_element_lookup(Structure, 'Location', 'Latitude')
-                        Longitude = optional_element_lookup(Structure, 'Location', 'Longitude')
-                        Condition = optional_element_lookup(Structure, 'Condition_E')
-                        MiniMap = optional_element_lookup(Structure, 'MiniMap')
-                        # 1:M elements
-                        UseTypesText = ''
-                        UseTypes = Structure.find('UseTypes')
-                        for UseType in UseTypes:
-                            if len(UseTypesText) > 0:
-                                UseTypesText += ' | '
-                            UseTypesText += UseType.find('Use_Name_E').text
-                        # output
-                        structure_writer.writerow([Property.find('Property_Number').text,
-                                                   Parcel.get('number'),
-                                                   Structure.find('Structure_Number').text,
-                                                   Structure.get('occupancy'),
-                                                   Structure.get('createdDate'),
-                                                   Structure.get('lastModifiedDate'),
-                                                   code,
-                                                   Structure.find('Structure_Name_E').text,
-                                                   Address,
-                                                   Latitude,
-                                                   Longitude,
-                                                   Structure.find('Interest_Type_E').text,
-                                                   Condition,
-                                                   Structure.find('Floor_Area').text,
-                                                   Structure.find('Floor_Area').get('unitofMeasure'),
-                                                   MiniMap,
-                                                   UseTypesText])
-
-                        # Tenants
-                        Tenants = Structure.find('Tenants')
-                        if Tenants is not None:
-                            # standard for loop not working here for some reason!!!
-                            # for Tenant in Tenants.find('Tenant'):
-                            for index in range(0, len(Tenants)):
-                                Tenant = Tenants[index]
-                                # output
-                                tenant_writer.writerow([Property.find('Property_Number').text,
-                                                        Parcel.get('number'),
-                                                        Structure.find('Structure_Number').text,
-                                                        Tenant.get('code'),
-                                                        Tenant.find('Name_E').text,
-                                                        Tenant.find('Floor_Area').text,
-                                                        Tenant.find('Floor_Area').get('unitofMeasure')])
-
-                        # Structure Photos
-                        Photos = Structure.find('Photos')
-                        if Photos is not None:
-                            for Photo in Photos:
-                                structure_photo_writer.writerow([Property.find('Property_Number').text,
-                                                                 Parcel.get('number'),
-                                                                 Structure.find('Structure_Number').text,
-                                                                 Photo.text])
-
-        # Federal Contaminated Sites
-        FederalContaminatedSites = Property.find('FederalContaminatedSites')
-        if FederalContaminatedSites is not None:
-            Sites = FederalContaminatedSites.findall('Site')
-            for FederalContaminatedSite in Sites:
-                # output
-                federal_contaminated_site_writer.writerow([Property.find('Property_Number').text,
-                                                           FederalContaminatedSite.get('FederalSiteIdentifier')])
-
-        # Property Photos
-        Photos = Property.find('Photos')
-        if Photos is not None:
-            for Photo in Photos:
-                # output
-                property_photo_writer.writerow([Property.find('Property_Number').text,
-                                                Photo.text])
-
-finally:
-    if property_file is not None:
-        property_file.close()
-    if parcel_file is not None:
-        parcel_file.close()
-    if structure_file is not None:
-        structure_file.close()
-    if structure_photo_file is not None:
-        structure_photo_file.close()
-    if tenant_file is not None:
-        tenant_file.close()
-    if federal_contaminated_site_file is not None:
-        federal_contaminated_site_file.close()
-    if property_photo_file is not None:
-        property_photo_file.close()
+# file name extensions of the compressed output formats
+compression_extensions = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz', 'zstd': '.zst'}
+
+
+# function to check that the module needed for a compression format is installed
+def check_compression(compression):
+    if compression not in compression_extensions:
+        raise ValueError('unknown compression %r' % compression)
+    if compression == 'xz' and lzma is None:
+        raise ImportError('xz compression requires the lzma module (backports.lzma on Python 2)')
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError('zstandard compression requires the zstandard package')
+
+
+# function to return a decompressor object for a compression format
+def decompressor(compression):
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    if compression == 'xz':
+        return lzma.LZMADecompressor()
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+# file object reading the decompressed data of a compressed stream (or, with no compression, the stream's data after
+# the bytes already read from it, for streams that cannot be rewound)
+# reads may return fewer bytes than asked for, as from a pipe; tell() and fileno() are those of the compressed stream,
+# so that progress is measured against the compressed file size; concatenated compressed streams, as written by pigz,
+# are read one after the other
+class DecompressedFile(object):
+    def __init__(self, stream, compression, data=b''):
+        self.stream = stream
+        self.compression = compression
+        self.decompressor = decompressor(compression) if compression is not None else None
+        self.data = data
+        self.position = 0
+        self.buffer = b''
+        self.offset = 0
+
+    def read(self, size=-1):
+        if size < 0:
+            return b''.join(iter(lambda: self.read(buffer_size), b''))
+        while self.offset >= len(self.buffer):
+            data = self.data or self.stream.read(buffer_size)
+            self.data = b''
+            if len(data) == 0:
+                return b''
+            self.position += len(data)
+            self.buffer = self.decompress(data)
+            self.offset = 0
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += len(data)
+        return data
+
+    def decompress(self, data):
+        if self.decompressor is None:
+            return data
+        parts = []
+        while len(data) > 0:
+            # data after the end of a compressed stream starts the next one, whether it came in the same read, and was
+            # left in unused_data, or the stream ended with the last read
+            if getattr(self.decompressor, 'eof', False) or len(getattr(self.decompressor, 'unused_data', b'')) > 0:
+                self.decompressor = decompressor(self.compression)
+            try:
+                parts.append(self.decompressor.decompress(data))
+            except EOFError:
+                # Python 2's bz2 decompressor has no eof, and only reports the end of its stream when given more data
+                self.decompressor = decompressor(self.compression)
+                parts.append(self.decompressor.decompress(data))
+            data = getattr(self.decompressor, 'unused_data', b'')
+        return b''.join(parts)
+
+    def tell(self):
+        return self.position
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    def close(self):
+        self.stream.close()
+
+
+# function to open the XML input, a path, '-' for standard input or a file object, decompressing it if it is compressed
+def open_input(source):
+    if source == '-':
+        stream = getattr(sys.stdin, 'buffer', sys.stdin)
+    elif hasattr(source, 'read'):
+        stream = source
+    else:
+        stream = open(source, 'rb')
+    try:
+        position = stream.tell()
+    except (AttributeError, EnvironmentError, ValueError):
+        position = None
+    start = stream.read(6)
+    for magic, compression in compression_magic:
+        if start.startswith(magic):
+            check_compression(compression)
+            return DecompressedFile(stream, compression, start)
+    # uncompressed input is read directly, unless it cannot be rewound to the start
+    if position is not None:
+        try:
+            stream.seek(position)
+            return stream
+        except (AttributeError, EnvironmentError, ValueError):
+            pass
+    return DecompressedFile(stream, None, start)
+
+
+# function to yield each top-level Property element of the XML file (a path or a file object)
+# in streaming mode, each Property is cleared from the tree once the caller is done with it, so memory stays flat
+def iterparse_properties(xml_file):
+    root = None
+    depth = 0
+    for event, element in ET.iterparse(xml_file, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                if element.tag == 'Property':
+                    yield element
+                root.clear()
+
+
+# function to convert a single Property element, and its related elements, to rows for each output table
+# custodians already in the custodians registry are not repeated in the custodian rows
+def convert_property(Property, custodians):
+    rows = {}
+    for table_name in table_names:
+        rows[table_name] = []
+    convert_element(tables['property'], Property, [], rows, custodians)
+    return rows
+
+
+# function to convert an element to a row of table, and its child elements to rows of the child tables
+def convert_element(table, element, keys, rows, custodians):
+    row, found = table.extract(element, keys)
+    rows[table.name].append(row)
+    if table.custodian:
+        check_add_custodian(found['Custodian'], custodians, rows['custodian'])
+    if len(table.child_tables) > 0:
+        child_keys = table.key(row)
+        for child_table in table.child_tables:
+            container = found.get(child_table.container)
+            if container is not None:
+                for child in container:
+                    if child_table.item == '*' or child.tag == child_table.item:
+                        convert_element(child_table, child, child_keys, rows, custodians)
+
+
+# file object collecting writes into blocks of at least size bytes before passing them on to stream, which may be a
+# compressor; it only closes stream if close is set, so that standard output and files passed in stay open
+class BufferedFile(object):
+    def __init__(self, stream, size, close=True):
+        self.stream = stream
+        self.size = size
+        self.close_stream = close
+        self.parts = []
+        self.length = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.length += len(data)
+        if self.length >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.length > 0:
+            self.stream.write(b''.join(self.parts))
+            self.parts = []
+            self.length = 0
+
+    def close(self):
+        self.flush()
+        if self.close_stream:
+            self.stream.close()
+        elif hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+
+# function to open a file for writing, compressed with compression
+# gzip uses compression level 6, like the gzip command, which is several times faster than Python's default of 9
+def compressed_file(path, compression):
+    check_compression(compression)
+    if compression == 'gzip':
+        return gzip.GzipFile(path, 'wb', 6)
+    if compression == 'bz2':
+        return bz2.BZ2File(path, 'wb')
+    if compression == 'xz':
+        return lzma.LZMAFile(path, 'wb')
+    return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+
+
+# function to open the file a CSV output table is written to: standard output or the file object in output_files, or
+# <table>.csv in path, compressed with output_compression, through a buffer of buffer_size bytes
+def open_csv_file(path, table_name):
+    target = output_files.get(table_name) if output_files is not None else None
+    if target == '-':
+        return BufferedFile(getattr(sys.stdout, 'buffer', sys.stdout), buffer_size, False)
+    if target is not None:
+        return BufferedFile(target, buffer_size, False)
+    if output_compression is None:
+        return open(path + table_name + '.csv', 'wb', buffer_size)
+    return BufferedFile(compressed_file(path + table_name + '.csv' + compression_extensions[output_compression],
+                                        output_compression), buffer_size)
+
+
+# interface of the outputs that rows are exported to, implemented by CsvOutput, SqliteOutput and ParquetOutput and by
+# the wrappers that pass rows on to another output; export() and export_records() also take any other sink
+# write() is passed a dictionary of table name to list of rows for some or all of the tables, each row a list of text
+# values in the order of the table's header in table_headers(); finish() is called after the last rows, and close()
+# always, last
+class Sink(object):
+    def write(self, rows):
+        raise NotImplementedError
+
+    # complete the output after the last rows have been written
+    def finish(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# CSV output tables, one file per table in path, each starting with its header
+class CsvOutput(Sink):
+    def __init__(self, path, headers):
+        self.files = {}
+        self.writers = {}
+        try:
+            for table_name, header in headers.items():
+                self.files[table_name] = open_csv_file(path, table_name)
+                self.writers[table_name] = csv.writer(self.files[table_name], dialect='excel', encoding='utf-8')
+                self.writers[table_name].writerow(header)
+        except:
+            self.close()
+            raise
+
+    # write rows, a dictionary of table name to list of rows
+    def write(self, rows):
+        for table_name, table_rows in rows.items():
+            self.writers[table_name].writerows(table_rows)
+
+    def close(self):
+        for table_file in self.files.values():
+            table_file.close()
+
+
+# SQLite output database, with a table for each output table
+# key columns are text, so the leading zeros of Property_Number, Parcel_number and Structure_Number are kept, and empty
+# values are stored as NULL; rows are inserted in transactions of batch_size rows, and the indexes on the join columns
+# are built once all rows have been loaded
+class SqliteOutput(Sink):
+    def __init__(self, path, headers):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.inserts = {}
+        self.pending = {}
+        self.pending_count = 0
+        self.indexes = []
+        for table_name, header in headers.items():
+            self.connection.execute('DROP TABLE IF EXISTS "%s"' % table_name)
+            self.connection.execute(self.create_table(table_name, header))
+            self.inserts[table_name] = 'INSERT INTO "%s" VALUES (%s)' % (table_name, ', '.join(['?'] * len(header)))
+            self.pending[table_name] = []
+        self.connection.commit()
+
+    # return the CREATE TABLE statement for an output table, and add its indexes to those built after the load
+    def create_table(self, table_name, header):
+        definitions = []
+        if table_name in tables:
+            table = tables[table_name]
+            types = table.types
+        else:
+            # incremental output table, with a leading change column
+            table = tables[table_name[:-len('_delta')]]
+            types = ['text'] + table.types
+        for name, column_type in zip(header, types):
+            definitions.append('"%s" %s' % (name, column_type.upper()))
+
+        if table_name not in tables:
+            self.indexes.append((table_name, 'key', table.key_names))
+        else:
+            if table_name == 'custodian' or len(table.child_tables) > 0:
+                definitions.append('PRIMARY KEY (%s)' % quote_names(table.key_names))
+            elif table.parent is not None:
+                self.indexes.append((table_name, table.parent.name, table.parent.key_names))
+            if table.parent is not None:
+                definitions.append('FOREIGN KEY (%s) REFERENCES "%s" (%s)' % (quote_names(table.parent.key_names),
+                                                                             table.parent.name,
+                                                                             quote_names(table.parent.key_names)))
+            if table.custodian:
+                definitions.append('FOREIGN KEY ("Custodian_code") REFERENCES "custodian" ("code")')
+                self.indexes.append((table_name, 'custodian', ['Custodian_code']))
+        return 'CREATE TABLE "%s" (%s)' % (table_name, ', '.join(definitions))
+
+    def write(self, rows):
+        for table_name, table_rows in rows.items():
+            self.pending[table_name].extend(table_rows)
+            self.pending_count += len(table_rows)
+        if self.pending_count >= batch_size:
+            self.flush()
+
+    # insert the pending rows in a single transaction
+    def flush(self):
+        for table_name, table_rows in self.pending.items():
+            if len(table_rows) > 0:
+                self.connection.executemany(self.inserts[table_name],
+                                            ([None if value == '' else value for value in row] for row in table_rows))
+                self.pending[table_name] = []
+        self.connection.commit()
+        self.pending_count = 0
+
+    def finish(self):
+        self.flush()
+        for table_name, index_name, names in self.indexes:
+            self.connection.execute('CREATE INDEX "%s_%s" ON "%s" (%s)' % (table_name, index_name, table_name,
+                                                                          quote_names(names)))
+        self.connection.commit()
+        violations = self.connection.execute('PRAGMA foreign_key_check').fetchall()
+        if len(violations) > 0:
+            sys.stderr.write('%d rows refer to missing rows in their parent tables\n' % len(violations))
+
+    def close(self):
+        self.connection.close()
+
+
+# Parquet output, with a typed columnar file for each output table
+# rows are buffered into columns of up to batch_size rows, each written as a row group, and the bilingual text columns
+# are dictionary encoded; as in the SQLite output, empty values are stored as nulls
+class ParquetOutput(Sink):
+    # functions to convert exported text to a value of each column type, with empty text as null
+    column_converters = dict(value_converters, text=lambda value: value if value != '' else None)
+
+    def __init__(self, path, headers):
+        if pyarrow is None:
+            raise ImportError('Parquet output requires the pyarrow package')
+        self.writers = {}
+        self.converters = {}
+        self.columns = {}
+        try:
+            for table_name, header in headers.items():
+                if table_name in tables:
+                    table = tables[table_name]
+                    types = table.types
+                    dictionary = [name for name, bilingual in zip(header, table.bilingual) if bilingual]
+                else:
+                    # incremental output table, with a leading change column
+                    table = tables[table_name[:-len('_delta')]]
+                    types = ['text'] + table.types
+                    dictionary = ['change'] + [name for name, bilingual in zip(header[1:], table.bilingual)
+                                               if bilingual]
+                schema = pyarrow.schema([pyarrow.field(name, parquet_types[column_type]())
+                                         for name, column_type in zip(header, types)])
+                self.writers[table_name] = pyarrow.parquet.ParquetWriter(path + table_name + '.parquet', schema,
+                                                                         use_dictionary=dictionary)
+                self.converters[table_name] = [(name, self.column_converters[column_type])
+                                               for name, column_type in zip(header, types)]
+                self.columns[table_name] = [[] for name in header]
+        except:
+            self.close()
+            raise
+
+    def write(self, rows):
+        for table_name, table_rows in rows.items():
+            columns = self.columns[table_name]
+            converters = self.converters[table_name]
+            for row in table_rows:
+                for values, value, (name, converter) in zip(columns, row, converters):
+                    try:
+                        values.append(converter(value))
+                    except ValueError:
+                        raise ValueError('%s %s value %r is not a number' % (table_name, name, value))
+            if len(columns[0]) >= batch_size:
+                self.flush(table_name)
+
+    # write a table's buffered columns as a row group
+    def flush(self, table_name):
+        writer = self.writers[table_name]
+        columns = self.columns[table_name]
+        if len(columns[0]) > 0:
+            arrays = [pyarrow.array(values, type=field.type) for values, field in zip(columns, writer.schema)]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=writer.schema))
+            self.columns[table_name] = [[] for values in columns]
+
+    def finish(self):
+        for table_name in self.writers:
+            self.flush(table_name)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+# Parquet column types, keyed by schema column type
+parquet_types = {'text': lambda: pyarrow.string(),
+                 'integer': lambda: pyarrow.int64(),
+                 'real': lambda: pyarrow.float64()}
+
+
+# function to quote a list of column names for SQL
+def quote_names(names):
+    return ', '.join('"%s"' % name for name in names)
+
+
+# grid spatial index of parcel and structure locations, for bounding box and nearest neighbour queries
+# points are kept in cells of cell_size degrees of latitude and longitude, and identified by their kind ('parcel' or
+# 'structure') and key (Property_Number and Parcel_number, or Property_Number, Parcel_number and Structure_Number)
+class SpatialIndex(object):
+    earth_radius = 6371.0088
+
+    def __init__(self, cell_size=0.5):
+        self.cell_size = cell_size
+        self.columns = int(math.ceil(360 / cell_size))
+        self.points = []
+        self.cells = {}
+        self.kind_counts = collections.defaultdict(int)
+
+    # add a point, returning False if its coordinates are missing or invalid
+    def add(self, kind, key, latitude, longitude):
+        try:
+            latitude = float(latitude)
+            longitude = float(longitude)
+        except ValueError:
+            return False
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return False
+        self.cells.setdefault(self.cell(latitude, longitude), []).append(len(self.points))
+        self.points.append((latitude, longitude, kind, tuple(key)))
+        self.kind_counts[kind] += 1
+        return True
+
+    def cell(self, latitude, longitude):
+        return (int(math.floor((latitude + 90) / self.cell_size)),
+                int(math.floor((longitude + 180) / self.cell_size)) % self.columns)
+
+    # return the occupied cells covering a latitude range and longitude range, where the longitude range may extend past
+    # 180 degrees either way
+    def occupied_cells(self, min_latitude, min_longitude, max_latitude, max_longitude):
+        min_row, min_column = self.cell(max(min_latitude, -90), min_longitude)
+        max_row, max_column = self.cell(min(max_latitude, 90), max_longitude)
+        if max_longitude - min_longitude >= 360:
+            columns = None
+        else:
+            columns = set([min_column])
+            while min_column != max_column:
+                min_column = (min_column + 1) % self.columns
+                columns.add(min_column)
+        # look the cells up directly unless there are fewer occupied cells than cells in the range
+        if columns is not None and (max_row - min_row + 1) * len(columns) <= len(self.cells):
+            return [(row, column) for row in range(min_row, max_row + 1) for column in columns
+                    if (row, column) in self.cells]
+        return [(row, column) for row, column in self.cells
+                if min_row <= row <= max_row and (columns is None or column in columns)]
+
+    # return the indexes of the points in the cells covering a latitude range and longitude range
+    def candidates(self, min_latitude, min_longitude, max_latitude, max_longitude):
+        return [index for cell in self.occupied_cells(min_latitude, min_longitude, max_latitude, max_longitude)
+                for index in self.cells[cell]]
+
+    # return the (kind, key) of the points inside a bounding box, optionally only those of the given kinds
+    # a box with min_longitude greater than max_longitude crosses the 180th meridian
+    def bbox(self, min_latitude, min_longitude, max_latitude, max_longitude, kinds=None):
+        if min_longitude > max_longitude:
+            max_longitude += 360
+        results = []
+        for index in self.candidates(min_latitude, min_longitude, max_latitude, max_longitude):
+            latitude, longitude, kind, key = self.points[index]
+            if longitude < min_longitude:
+                longitude += 360
+            if (min_latitude <= latitude <= max_latitude and longitude <= max_longitude and
+                    (kinds is None or kind in kinds)):
+                results.append((kind, key))
+        return results
+
+    # return the (distance in km, kind, key) of the k points nearest to a location, closest first, optionally only
+    # those of the given kinds
+    def nearest(self, latitude, longitude, k=1, kinds=None):
+        if kinds is None:
+            k = min(k, len(self.points))
+        else:
+            k = min(k, sum(self.kind_counts.get(kind, 0) for kind in set(kinds)))
+        if k <= 0:
+            return []
+        # widen the search, doubling its radius, until it holds k points, then search the box holding every point as
+        # close as the kth closest of those, since points in the corners may be further than points outside; distances
+        # are only worked out for the cells each step adds
+        searched = set()
+        found = []
+
+        def search(min_latitude, min_longitude, max_latitude, max_longitude):
+            cells = [cell for cell in self.occupied_cells(min_latitude, min_longitude, max_latitude, max_longitude)
+                     if cell not in searched]
+            searched.update(cells)
+            found.extend(self.distances(latitude, longitude, [index for cell in cells for index in self.cells[cell]],
+                                        kinds))
+
+        radius = self.cell_size
+        while True:
+            search(latitude - radius, longitude - radius, latitude + radius, longitude + radius)
+            if len(found) >= k or len(searched) == len(self.cells):
+                break
+            radius *= 2
+        distance = sorted(found)[k - 1][0]
+        latitude_radius = math.degrees(distance / self.earth_radius)
+        max_latitude = min(abs(latitude) + latitude_radius, 90)
+        if max_latitude >= 89.9:
+            longitude_radius = 180
+        else:
+            longitude_radius = min(latitude_radius / math.cos(math.radians(max_latitude)), 180)
+        search(latitude - latitude_radius, longitude - longitude_radius, latitude + latitude_radius,
+               longitude + longitude_radius)
+        return sorted(found)[:k]
+
+    # return the (great circle distance in km, kind, key) of the given points from a location
+    def distances(self, latitude, longitude, indexes, kinds):
+        results = []
+        latitude_radians = math.radians(latitude)
+        for index in indexes:
+            point_latitude, point_longitude, kind, key = self.points[index]
+            if kinds is None or kind in kinds:
+                point_latitude_radians = math.radians(point_latitude)
+                haversine = (math.sin((point_latitude_radians - latitude_radians) / 2) ** 2 +
+                             math.cos(latitude_radians) * math.cos(point_latitude_radians) *
+                             math.sin(math.radians(point_longitude - longitude) / 2) ** 2)
+                distance = 2 * self.earth_radius * math.asin(min(1, math.sqrt(haversine)))
+                results.append((distance, kind, key))
+        return results
+
+    def save(self, path):
+        with open(path, 'w') as index_file:
+            json.dump({'cell_size': self.cell_size,
+                       'points': [[kind, latitude, longitude] + list(key)
+                                  for latitude, longitude, kind, key in self.points]},
+                      index_file, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as index_file:
+            saved = json.load(index_file)
+        index = cls(saved['cell_size'])
+        for point in saved['points']:
+            index.add(point[0], point[3:], point[1], point[2])
+        return index
+
+
+# output that adds the parcel and structure locations to a spatial index, saved to path when the export is complete,
+# before passing the rows on to another output
+class SpatialIndexOutput(Sink):
+    # coordinate columns of the indexed tables
+    location_columns = {'parcel': ('Location_Latitude', 'Location_Longitude'),
+                        'structure': ('Latitude', 'Longitude')}
+
+    def __init__(self, output, path):
+        self.output = output
+        self.path = path
+        self.index = SpatialIndex()
+
+    def write(self, rows):
+        for table_name, (latitude_column, longitude_column) in self.location_columns.items():
+            table = tables[table_name]
+            latitude_index = table.header.index(latitude_column)
+            longitude_index = table.header.index(longitude_column)
+            for row in rows.get(table_name, []):
+                if row[latitude_index] != '' and row[longitude_index] != '':
+                    self.index.add(table_name, table.key(row), row[latitude_index], row[longitude_index])
+        self.output.write(rows)
+
+    def finish(self):
+        self.output.finish()
+        self.index.save(self.path)
+
+    def close(self):
+        self.output.close()
+
+
+# function to open the output for output_format, with the given table headers
+def open_output(headers):
+    if output_format == 'sqlite':
+        return SqliteOutput(starting_path + 'dfrp-rbif.sqlite', headers)
+    if output_format == 'parquet':
+        return ParquetOutput(starting_path, headers)
+    return CsvOutput(starting_path, headers)
+
+
+# function to return the paths of the files written by open_output(), for output tables table_names
+def output_paths(table_names):
+    if output_format == 'sqlite':
+        return [starting_path + 'dfrp-rbif.sqlite']
+    if output_format == 'parquet':
+        extension = '.parquet'
+    else:
+        extension = '.csv' + compression_extensions.get(output_compression, '')
+    return [starting_path + table_name + extension for table_name in table_names]
+
+
+# function to return the output table headers, keyed by table name
+def table_headers():
+    return collections.OrderedDict((table_name, tables[table_name].header) for table_name in table_names)
+
+
+# tables with their own modification dates; rows of the other tables (except custodian) belong to the nearest of these
+# above them, and are assumed unchanged when its dates are unchanged
+dated_table_names = ['property', 'structure']
+
+
+# function to return the table with modification dates that the rows of a table belong to
+def dated_table(table):
+    while table.name not in dated_table_names:
+        table = table.parent
+    return table
+
+
+# function to return the incremental output table headers, keyed by table name
+# the custodian table is always written in full, the other tables as <table>_delta with a leading change column
+def delta_headers():
+    headers = collections.OrderedDict()
+    for table_name, header in table_headers().items():
+        if table_name == 'custodian':
+            headers[table_name] = header
+        else:
+            headers[table_name + '_delta'] = ['change'] + header
+    return headers
+
+
+# incremental output, writing only the rows inserted, updated or deleted since the previous run
+# the state file holds, for each Property and Structure, its createdDate and lastModifiedDate, and the keys of the rows
+# that belong to it; a record with new dates has its rows written as inserts and updates, and its rows that are gone as
+# deletes, and records missing from this run are written as deletes once all Properties have been seen
+class DeltaOutput(Sink):
+    def __init__(self, output, state_path):
+        self.output = output
+        self.state_path = state_path
+        # dated table name -> names of the undated tables whose rows belong to its records
+        self.belonging_table_names = {}
+        # dated table name -> {record key: [dates, {table name: [row keys]}]}
+        self.previous = {}
+        self.current = {}
+        for table_name in dated_table_names:
+            self.belonging_table_names[table_name] = []
+            self.previous[table_name] = {}
+            self.current[table_name] = {}
+        for table_name in table_names[1:]:
+            if table_name not in dated_table_names:
+                self.belonging_table_names[dated_table(tables[table_name]).name].append(table_name)
+        if os.path.exists(state_path):
+            with open(state_path, 'r') as state_file:
+                self.previous.update(json.load(state_file))
+
+    def write(self, rows):
+        delta_rows = {'custodian': rows.get('custodian', [])}
+        for table_name in table_names[1:]:
+            delta_rows[table_name + '_delta'] = []
+
+        # group the rows of the undated tables by the record they belong to
+        record_rows = {}
+        for dated_name in dated_table_names:
+            dated = tables[dated_name]
+            for table_name in self.belonging_table_names[dated_name]:
+                table = tables[table_name]
+                for row in rows.get(table_name, []):
+                    key = table.key(row)
+                    record_key = '\t'.join(key[:len(dated.key_names)])
+                    table_rows = record_rows.setdefault((dated_name, record_key), {})
+                    keyed_rows = table_rows.setdefault(table_name, collections.OrderedDict())
+                    # a record can have several tenants, photos or contaminated sites with the same key, so rows after
+                    # the first with a key are told apart by their occurrence number
+                    row_key = '\t'.join(key)
+                    if row_key in keyed_rows:
+                        occurrence = 2
+                        while '%s\t%d' % (row_key, occurrence) in keyed_rows:
+                            occurrence += 1
+                        row_key = '%s\t%d' % (row_key, occurrence)
+                    keyed_rows[row_key] = row
+
+        for dated_name in dated_table_names:
+            dated = tables[dated_name]
+            created_index = dated.header.index('createdDate')
+            modified_index = dated.header.index('lastModifiedDate')
+            for row in rows.get(dated_name, []):
+                record_key = '\t'.join(dated.key(row))
+                dates = row[created_index] + '\t' + row[modified_index]
+                table_rows = record_rows.get((dated_name, record_key), {})
+                self.current[dated_name][record_key] = [dates, dict((table_name, list(keyed_rows.keys()))
+                                                                    for table_name, keyed_rows in table_rows.items())]
+                previous = self.previous[dated_name].pop(record_key, None)
+                if previous is None:
+                    delta_rows[dated_name + '_delta'].append(['insert'] + row)
+                    previous_keys = {}
+                elif previous[0] != dates:
+                    delta_rows[dated_name + '_delta'].append(['update'] + row)
+                    previous_keys = previous[1]
+                else:
+                    continue
+                for table_name in self.belonging_table_names[dated_name]:
+                    keyed_rows = table_rows.get(table_name, {})
+                    previous_table_keys = previous_keys.get(table_name, [])
+                    for row_key, table_row in keyed_rows.items():
+                        change = 'update' if row_key in previous_table_keys else 'insert'
+                        delta_rows[table_name + '_delta'].append([change] + table_row)
+                    for row_key in previous_table_keys:
+                        if row_key not in keyed_rows:
+                            delta_rows[table_name + '_delta'].append(['delete'] + self.key_row(table_name, row_key))
+
+        self.output.write(delta_rows)
+
+    # return a deleted row, with only its key columns (leaving out the occurrence number of a repeated key)
+    def key_row(self, table_name, row_key):
+        table = tables[table_name]
+        return table.key_row(row_key.split('\t')[:len(table.key_names)])
+
+    # write the records that were not seen in this run as deletes, and save the state for the next run
+    def finish(self):
+        delta_rows = collections.defaultdict(list)
+        for dated_name in dated_table_names:
+            for record_key, (dates, previous_keys) in sorted(self.previous[dated_name].items()):
+                delta_rows[dated_name + '_delta'].append(['delete'] + self.key_row(dated_name, record_key))
+                for table_name, row_keys in previous_keys.items():
+                    for row_key in row_keys:
+                        delta_rows[table_name + '_delta'].append(['delete'] + self.key_row(table_name, row_key))
+        self.output.write(delta_rows)
+        self.output.finish()
+        with open(self.state_path, 'w') as state_file:
+            json.dump(self.current, state_file, separators=(',', ':'))
+
+    def close(self):
+        self.output.close()
+
+
+# cache of converted Properties, keyed by the hash of their serialized XML
+# each entry holds the result of convert_isolated(), pickled; entries are marked with the number of the run that last
+# used them, and the least recently used are evicted at the end of a run; the whole cache is discarded if its
+# fingerprint, the schema and options that affect conversion, changes
+class ParseCache(object):
+    def __init__(self, path, size, fingerprint):
+        self.size = size
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS setting (name TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS property '
+                                '(hash TEXT PRIMARY KEY, result BLOB, used INTEGER)')
+        if self.setting('fingerprint') != fingerprint:
+            self.connection.execute('DELETE FROM property')
+            self.connection.execute('DELETE FROM setting')
+            self.set_setting('fingerprint', fingerprint)
+        self.run = int(self.setting('run') or 0) + 1
+        self.set_setting('run', str(self.run))
+        self.connection.commit()
+        self.inserts = []
+        self.uses = []
+
+    def setting(self, name):
+        row = self.connection.execute('SELECT value FROM setting WHERE name = ?', (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_setting(self, name, value):
+        self.connection.execute('INSERT OR REPLACE INTO setting VALUES (?, ?)', (name, value))
+
+    # return the key of a serialized Property
+    def key(self, serialized):
+        return hashlib.sha1(serialized).hexdigest()
+
+    # return the cached result for key, or None
+    def get(self, key):
+        row = self.connection.execute('SELECT result FROM property WHERE hash = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.uses.append((self.run, key))
+        if len(self.uses) >= batch_size:
+            self.flush()
+        return pickle.loads(bytes(row[0]))
+
+    # cache a result, pickled straight away since the caller may go on to change it
+    def put(self, key, result):
+        self.inserts.append((key, sqlite3.Binary(pickle.dumps(result, 2)), self.run))
+        if len(self.inserts) >= batch_size:
+            self.flush()
+
+    def flush(self):
+        self.connection.executemany('INSERT OR REPLACE INTO property VALUES (?, ?, ?)', self.inserts)
+        self.connection.executemany('UPDATE property SET used = ? WHERE hash = ?', self.uses)
+        self.connection.commit()
+        self.inserts = []
+        self.uses = []
+
+    # return True if the last completed run was for the same input file and options
+    def unchanged(self, run_key):
+        return self.setting('last_run') == run_key
+
+    # evict the least recently used entries beyond size, and record the completed run (None for a run that cannot be
+    # skipped next time)
+    def finish(self, run_key):
+        self.flush()
+        self.connection.execute('DELETE FROM property WHERE hash NOT IN '
+                                '(SELECT hash FROM property ORDER BY used DESC LIMIT ?)', (self.size,))
+        self.set_setting('last_run', run_key or '')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+# function to return the hash of a file's contents, read in blocks
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as hashed_file:
+        for block in iter(lambda: hashed_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# function to yield each top-level Property element of an XML file object as it appears in the file, without parsing it,
+# for the cache and the worker processes; Property elements are found by their tags, so the file must not have Property
+# tags inside comments or CDATA sections, and the XML declaration, if any, is prepended to each so it parses with the
+# file's encoding
+def split_properties(xml_file):
+    buffer = b''
+    declaration = None
+    for block in iter(lambda: xml_file.read(1 << 20), b''):
+        buffer += block
+        if declaration is None:
+            declaration = buffer[:buffer.find(b'?>') + 2] if buffer.startswith(b'<?xml') else b''
+        position = 0
+        while True:
+            start = buffer.find(b'<Property', position)
+            while start >= 0 and buffer[start + 9:start + 10] not in b' \t\r\n>':
+                start = buffer.find(b'<Property', start + 9)
+            if start < 0 or start + 10 > len(buffer):
+                buffer = buffer[start:] if start >= 0 else buffer[max(position, len(buffer) - 9):]
+                break
+            end = buffer.find(b'</Property>', start)
+            if end < 0:
+                buffer = buffer[start:]
+                break
+            position = end + 11
+            yield declaration + buffer[start:position]
+
+
+# function to convert a single Property element with a registry of its own, so that its rows include every custodian it
+# refers to and can be cached without depending on the Properties before it; returns a result as written by
+# write_result()
+def convert_isolated(Property):
+    custodians = CustodianRegistry(check_custodian_conflicts)
+    return [convert_property(Property, custodians)], custodians.conflicts
+
+
+# function to return the result for a serialized Property from the cache, converting and caching it if it is not there
+def convert_cached(Property, cache):
+    key = cache.key(Property)
+    result = cache.get(key)
+    if result is None:
+        result = convert_isolated(ET.fromstring(Property))
+        cache.put(key, result)
+    return result
+
+
+# function to build the Property record, with the records below it, from the rows of a result of convert_isolated()
+# the Custodian records are built from the Property's own Custodian elements, the first for each code, like its rows
+def build_record(rows):
+    custodian_class = record_classes['custodian']
+    custodian_records = {}
+    for row in rows['custodian']:
+        custodian_records[row[0]] = custodian_class(row)
+    property_record = None
+    records = {}
+    for table_name in table_names[1:]:
+        table = tables[table_name]
+        record_class = record_classes[table_name]
+        for row in rows[table_name]:
+            record = record_class(row)
+            key = tuple(table.key(row))
+            records[table_name, key] = record
+            if table.parent is None:
+                property_record = record
+            else:
+                getattr(records[table.parent.name, key[:-1]], record_class._attribute).append(record)
+            if table.custodian:
+                record.custodian = custodian_records.get(record.Custodian_code)
+    return property_record
+
+
+# function to return the Property record of a result of convert_isolated(), for the predicate of export()
+def result_record(result):
+    return build_record(result[0][0])
+
+
+# function to return the XML dump read when no other is given: input_path, or dfrp-rbif.xml in starting_path
+def default_input():
+    return input_path if input_path is not None else starting_path + 'dfrp-rbif.xml'
+
+
+# function to yield a Property record for each Property in source, a path, '-' for standard input or a file object,
+# optionally compressed (None reads default_input()), as soon as it has been parsed
+# the file is only opened once the first record is asked for, and closed when the last has been read, unless it is
+# standard input or a file object
+def read_records(source=None):
+    if source is None:
+        source = default_input()
+    xml_file = open_input(source)
+    try:
+        for Property in iterparse_properties(xml_file):
+            yield build_record(convert_isolated(Property)[0][0])
+    finally:
+        if source != '-' and not hasattr(source, 'read'):
+            xml_file.close()
+
+
+# function to write the rows of records, such as those from read_records(), to sink, and finish it, leaving the caller
+# to close it; each custodian is written once, the first time a record refers to it
+def export_records(records, sink):
+    custodians = CustodianRegistry()
+    for record in records:
+        write_result(([record.rows()], []), custodians, sink)
+    sink.finish()
+
+
+# function to group serialized Properties into chunks that can be passed to worker processes
+def chunks(properties, size):
+    chunk = []
+    for Property in properties:
+        chunk.append(Property)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+# function run in a worker process to convert a chunk of serialized Properties to a list of results
+# custodians are only deduplicated within the chunk, so the rows still need to be checked against the main registry;
+# isolated chunks are converted a Property at a time with convert_isolated(), for the cache
+def convert_chunk(chunk, isolated=False):
+    if isolated:
+        return [convert_isolated(ET.fromstring(Property)) for Property in chunk]
+    custodians = CustodianRegistry(check_custodian_conflicts)
+    chunk_rows = [convert_property(ET.fromstring(Property), custodians) for Property in chunk]
+    return [(chunk_rows, custodians.conflicts)]
+
+
+# function run as each worker process starts, to apply the settings that affect conversion, which workers started
+# without fork (on Windows) would otherwise take from the top of this file
+def start_worker(worker_languages, worker_check_custodian_conflicts):
+    configure(languages=worker_languages, check_custodian_conflicts=worker_check_custodian_conflicts)
+
+
+# function to convert serialized Properties to rows in a pool of worker processes, and write the rows in document order
+# with a cache, only the Properties missing from it are sent to the workers; with a predicate, the Properties are
+# converted on their own and only those whose records it accepts are written
+def export_parallel(properties, custodians, output, cache=None, predicate=None):
+    pool = multiprocessing.Pool(processes, start_worker, (languages, check_custodian_conflicts))
+    try:
+        # keep a bounded number of chunks in flight, so memory stays flat when the workers fall behind
+        pending = collections.deque()
+        for chunk in chunks(properties, chunk_size):
+            if cache is None:
+                pending.append((None, pool.apply_async(convert_chunk, (chunk, predicate is not None))))
+            else:
+                keys = [cache.key(Property) for Property in chunk]
+                cached = [(key, cache.get(key)) for key in keys]
+                misses = [Property for Property, (_, result) in zip(chunk, cached) if result is None]
+                pending.append((cached, pool.apply_async(convert_chunk, (misses, True))))
+            while len(pending) > 2 * processes:
+                write_pending(pending.popleft(), custodians, output, cache, predicate)
+        while len(pending) > 0:
+            write_pending(pending.popleft(), custodians, output, cache, predicate)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+# function to write the results of a chunk handed to the workers, in document order, filling in and caching the
+# results converted by the workers, and dropping those the predicate rejects
+def write_pending(chunk, custodians, output, cache, predicate):
+    cached, async_result = chunk
+    if metrics is not None:
+        stage = metrics.switch('extract')
+    results = async_result.get()
+    if metrics is not None:
+        metrics.switch(stage)
+    if cached is not None:
+        converted = iter(results)
+        results = []
+        for key, result in cached:
+            if result is None:
+                result = next(converted)
+                cache.put(key, result)
+            results.append(result)
+    for result in results:
+        if predicate is None or predicate(result_record(result)):
+            write_result(result, custodians, output)
+
+
+# function to write the rows of a result, a list of rows for each table and the custodian conflicts found while
+# converting them, dropping custodians already written by an earlier result
+def write_result(result, custodians, output):
+    chunk_rows, conflicts = result
+    for rows in chunk_rows:
+        if metrics is not None:
+            stage = metrics.switch('custodian')
+        rows['custodian'] = [row for row in rows['custodian'] if custodians.add(row)]
+        if metrics is not None:
+            metrics.switch(stage)
+        output.write(rows)
+    # conflicts found while converting are relative to the result's first row, so compare them to the run's first row
+    for code, column, first_value, value in conflicts:
+        custodians.add_conflict(code, column, first_value)
+        custodians.add_conflict(code, column, value)
+
+
+# measurements of an instrumented run
+# the run is always in exactly one stage: switch() charges the time since the last switch to the stage being left, so
+# nested stages (custodian deduplication during extraction) are not counted twice, and the stages add up to the run
+class Metrics(object):
+    def __init__(self, xml_file, interval):
+        self.xml_file = xml_file
+        try:
+            self.size = os.fstat(xml_file.fileno()).st_size
+        except (AttributeError, EnvironmentError, ValueError):
+            self.size = None
+        self.interval = interval
+        self.start = time.time()
+        self.mark = self.start
+        self.next_progress = self.start + interval if interval is not None else None
+        self.stage = 'other'
+        self.seconds = collections.defaultdict(float)
+        self.rows = collections.OrderedDict()
+        self.properties = 0
+
+    # enter stage, returning the stage left so the caller can switch back to it
+    def switch(self, stage):
+        now = time.time()
+        self.seconds[self.stage] += now - self.mark
+        self.mark = now
+        previous = self.stage
+        self.stage = stage
+        return previous
+
+    # return function wrapped to run in stage
+    def measure(self, stage, function):
+        def measured(*arguments):
+            previous = self.switch(stage)
+            result = function(*arguments)
+            self.switch(previous)
+            return result
+        return measured
+
+    # yield properties, charging the time taken to read and parse them to the parse stage, and reporting progress
+    def measure_properties(self, properties):
+        properties = iter(properties)
+        while True:
+            previous = self.switch('parse')
+            try:
+                Property = next(properties)
+            except StopIteration:
+                self.switch(previous)
+                return
+            self.switch(previous)
+            self.properties += 1
+            if self.next_progress is not None and self.mark >= self.next_progress:
+                self.progress()
+                self.next_progress = self.mark + self.interval
+            yield Property
+
+    # return the number of bytes of the XML file read so far, or None if it is unknown
+    def position(self):
+        try:
+            return self.xml_file.tell()
+        except (AttributeError, EnvironmentError, ValueError):
+            return None
+
+    def progress(self):
+        elapsed = self.mark - self.start
+        position = self.position()
+        message = '%d Properties' % self.properties
+        if elapsed > 0:
+            message += ', %.0f Properties/s' % (self.properties / elapsed)
+        if position is not None:
+            message += ', %.1f MB read' % (position / 1048576.0)
+            if self.size and position > 0:
+                remaining = elapsed * (self.size - position) / position
+                message += ' of %.1f MB, about %d:%02d remaining' % (self.size / 1048576.0, remaining // 60,
+                                                                     remaining % 60)
+        sys.stderr.write(message + '\n')
+
+    # return the measurements of the run so far: seconds spent in each stage, with the time spent writing each output
+    # table under write, and rows written to each output table
+    def report(self):
+        self.switch(self.stage)
+        elapsed = self.mark - self.start
+        stages = collections.OrderedDict()
+        writes = collections.OrderedDict()
+        for stage in ['parse', 'extract', 'custodian', 'finish', 'other']:
+            stages[stage] = self.seconds.get(stage, 0.0)
+        for table_name in self.rows:
+            writes[table_name] = self.seconds.get(('write', table_name), 0.0)
+        stages['write'] = writes
+        return collections.OrderedDict([('seconds', elapsed), ('properties', self.properties),
+                                        ('properties_per_second', self.properties / elapsed if elapsed > 0 else None),
+                                        ('bytes', self.position()), ('stages', stages), ('rows', self.rows)])
+
+    def print_report(self, report):
+        sys.stderr.write('%d Properties in %.1f s\n' % (report['properties'], report['seconds']))
+        for stage, seconds in report['stages'].items():
+            if stage != 'write':
+                sys.stderr.write('    %-40s %8.2f s\n' % (stage, seconds))
+        for table_name, seconds in report['stages']['write'].items():
+            sys.stderr.write('    %-40s %8.2f s %10d rows\n' % ('write ' + table_name, seconds,
+                                                                  report['rows'][table_name]))
+
+
+# output wrapper charging the time spent writing each output table to its own stage, and counting its rows
+class MeasuredOutput(Sink):
+    def __init__(self, output, metrics, headers):
+        self.output = output
+        self.metrics = metrics
+        for table_name in headers:
+            metrics.rows[table_name] = 0
+
+    def write(self, rows):
+        for table_name, table_rows in rows.items():
+            previous = self.metrics.switch(('write', table_name))
+            self.output.write({table_name: table_rows})
+            self.metrics.switch(previous)
+            self.metrics.rows[table_name] += len(table_rows)
+
+    def finish(self):
+        previous = self.metrics.switch('finish')
+        self.output.finish()
+        self.metrics.switch(previous)
+
+    def close(self):
+        self.output.close()
+
+
+# measurements of the current run, while it is instrumented
+metrics = None
+
+
+# function to export default_input() with the current settings
+# predicate, if given, is called with the Property record of each Property, and only those it returns True for are
+# written (with the custodians they refer to); sink, if given, receives the rows instead of the output for
+# output_format, with the headers of delta_headers() for incremental runs, and is closed at the end of the export
+# incremental runs can't be filtered, as the Properties left out would be written as deleted and dropped from the state
+def export(predicate=None, sink=None):
+    global metrics
+    if predicate is not None and delta_state_path is not None:
+        raise ValueError('an incremental export (delta_state_path) cannot be filtered with a predicate')
+    xml_path = default_input()
+    # standard input and file objects are read once, and left open
+    is_path = xml_path != '-' and not hasattr(xml_path, 'read')
+    xml_file = None
+    output = None
+    cache = None
+
+    # Properties
+    try:
+        # skip the run if the input file and options are the same as for the last completed run, and its output, with
+        # the spatial index, is still there; incremental runs are never skipped, since their output replaces the
+        # previous run's changes, and neither are runs from standard input or file objects, or to output files or sinks,
+        # filtered runs, or measured runs, which would have nothing to measure
+        if cache_path is not None:
+            cache = ParseCache(cache_path, cache_size, repr((schema, languages, check_custodian_conflicts)))
+            run_key = None
+            if is_path and output_files is None and predicate is None and sink is None and metrics_path is None:
+                run_key = '\t'.join([file_hash(xml_path), repr((starting_path, output_format, output_compression,
+                                                                 batch_size, spatial_index, custodian_registry_path))])
+            paths = output_paths(table_names)
+            if spatial_index:
+                paths.append(starting_path + 'spatial_index.json')
+            if (run_key is not None and delta_state_path is None and cache.unchanged(run_key) and
+                    all(os.path.exists(path) for path in paths)):
+                sys.stderr.write('%s is unchanged since the last run; skipping export\n' % xml_path)
+                return
+
+        # build lookup table of unique custodian values, starting from the previous run's table if there is one
+        custodians = CustodianRegistry(check_custodian_conflicts)
+        if custodian_registry_path is not None and os.path.exists(custodian_registry_path):
+            custodians.load(custodian_registry_path)
+        xml_file = open_input(xml_path)
+        if progress_interval is not None or metrics_path is not None:
+            metrics = Metrics(xml_file, progress_interval)
+        headers = table_headers() if delta_state_path is None else delta_headers()
+        output = open_output(headers) if sink is None else sink
+        if metrics is not None:
+            output = MeasuredOutput(output, metrics, headers)
+        if delta_state_path is not None:
+            output = DeltaOutput(output, delta_state_path)
+        if spatial_index:
+            output = SpatialIndexOutput(output, starting_path + 'spatial_index.json')
+
+        # data rows
+        output.write({'custodian': list(custodians.rows.values())})
+        parse = ET.parse if metrics is None else metrics.measure('parse', ET.parse)
+        if cache is not None or processes > 1:
+            # Properties are cut out of the file without parsing them, so they are only parsed once: by the worker
+            # processes, or, with the cache, when they are not in the cache
+            properties = split_properties(xml_file)
+        elif streaming:
+            properties = iterparse_properties(xml_file)
+        else:
+            properties = parse(xml_file).getroot().findall('Property')
+        if metrics is not None:
+            properties = metrics.measure_properties(properties)
+        if processes > 1:
+            export_parallel(properties, custodians, output, cache, predicate)
+        elif cache is not None or predicate is not None:
+            # Properties are converted on their own, so their results can be cached, or dropped with their custodians
+            if cache is not None:
+                convert = lambda Property: convert_cached(Property, cache)
+            else:
+                convert = convert_isolated
+            if metrics is not None:
+                convert = metrics.measure('extract', convert)
+            for Property in properties:
+                result = convert(Property)
+                if predicate is None or predicate(result_record(result)):
+                    write_result(result, custodians, output)
+        else:
+            convert = convert_property if metrics is None else metrics.measure('extract', convert_property)
+            for Property in properties:
+                output.write(convert(Property, custodians))
+        output.finish()
+        if cache is not None:
+            cache.finish(run_key)
+
+        # measurements
+        if metrics is not None:
+            report = metrics.report()
+            if progress_interval is not None:
+                metrics.print_report(report)
+            if metrics_path is not None:
+                with open(metrics_path, 'w') as metrics_file:
+                    json.dump(report, metrics_file, indent=2)
+
+        # custodian lookup table, for the next run
+        if custodian_registry_path is not None:
+            custodians.save(custodian_registry_path)
+        for code, column, first_value, value in custodians.conflicts:
+            sys.stderr.write('Custodian %s has conflicting %s: %r, first seen as %r\n' % (code, column, value,
+                                                                                             first_value))
+
+    finally:
+        metrics = None
+        if output is not None:
+            output.close()
+        if xml_file is not None and is_path:
+            xml_file.close()
+        if cache is not None:
+            cache.close()
+
+
+# function to return a predicate for export() that keeps the Properties with one of custodian_codes and with a parcel in
+# one of provinces, in any exported language and ignoring case (None if neither is given)
+def property_filter(custodian_codes=None, provinces=None):
+    if not custodian_codes and not provinces:
+        return None
+    province_names = [name for name in tables['parcel'].header if name.startswith('Location_Province')]
+    provinces = set(province.lower() for province in provinces or [])
+
+    def predicate(record):
+        if custodian_codes and record.Custodian_code not in custodian_codes:
+            return False
+        return not provinces or any(getattr(parcel, name).lower() in provinces
+                                    for parcel in record.parcels for name in province_names)
+    return predicate
+
+
+# function to decode a command line argument to text, as Python 2 passes them as bytes
+def text_argument(value):
+    return value.decode(sys.getfilesystemencoding() or 'utf-8') if isinstance(value, bytes) else value
+
+
+# command line: options override the settings at the top of this file, which apply to those not given
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Export the Directory of Federal Real Property XML dump to CSV, '
+                                     'SQLite or Parquet tables.', argument_default=argparse.SUPPRESS)
+    parser.add_argument('input_path', nargs='?', metavar='input',
+                        help='XML dump, optionally compressed, or - for standard input (default: dfrp-rbif.xml in the '
+                        'output directory)')
+    parser.add_argument('-o', '--output-directory', dest='starting_path', metavar='DIRECTORY',
+                        help='directory of the output files (default: %s)' % starting_path)
+    parser.add_argument('-f', '--format', dest='output_format', choices=['csv', 'sqlite', 'parquet'],
+                        help='output format (default: %s)' % output_format)
+    parser.add_argument('--compression', dest='output_compression', choices=sorted(compression_extensions),
+                        help='compress the CSV files')
+    parser.add_argument('--stdout', metavar='TABLE', choices=table_names,
+                        help='write this CSV table (or its _delta table, with --delta-state) to standard output '
+                        'instead of a file')
+    parser.add_argument('--languages', nargs='+', choices=['E', 'F'],
+                        help='languages of the bilingual columns (default: %s)' % ' '.join(languages))
+    parser.add_argument('--processes', type=int, help='number of worker processes (default: %d)' % processes)
+    parser.add_argument('--chunk-size', type=int, help='Properties handed to a worker at a time')
+    parser.add_argument('--batch-size', type=int, help='rows per SQLite transaction or Parquet row group')
+    parser.add_argument('--no-streaming', dest='streaming', action='store_false',
+                        help='load the whole XML tree before converting it')
+    parser.add_argument('--spatial-index', action='store_true', help='also write spatial_index.json')
+    parser.add_argument('--delta-state', dest='delta_state_path', metavar='PATH',
+                        help='state file for incremental export')
+    parser.add_argument('--cache', dest='cache_path', metavar='PATH', help='parse cache file')
+    parser.add_argument('--cache-size', type=int, help='number of Properties kept in the parse cache')
+    parser.add_argument('--custodian-registry', dest='custodian_registry_path', metavar='PATH',
+                        help='custodian lookup table kept between runs')
+    parser.add_argument('--check-custodian-conflicts', action='store_true',
+                        help='report custodians whose metadata differs between records')
+    parser.add_argument('--progress', dest='progress_interval', type=float, metavar='SECONDS',
+                        help='print progress to stderr every SECONDS seconds, then the time spent in each stage')
+    parser.add_argument('--metrics', dest='metrics_path', metavar='PATH', help='write the run measurements as JSON')
+    parser.add_argument('--custodian', action='append', type=text_argument, metavar='CODE',
+                        help='only export the Properties with this custodian code (may be repeated)')
+    parser.add_argument('--province', action='append', type=text_argument, metavar='NAME',
+                        help='only export the Properties with a parcel in this province (may be repeated)')
+    settings = vars(parser.parse_args(arguments))
+    predicate = property_filter(settings.pop('custodian', None), settings.pop('province', None))
+    if predicate is not None and settings.get('delta_state_path', delta_state_path) is not None:
+        parser.error('--custodian and --province cannot be used with an incremental export (--delta-state)')
+    if 'stdout' in settings:
+        if settings.get('output_format', output_format) != 'csv':
+            parser.error('--stdout can only be used with CSV output')
+        table_name = settings.pop('stdout')
+        # incremental exports write every table but custodian as <table>_delta
+        if settings.get('delta_state_path', delta_state_path) is not None and table_name != 'custodian':
+            table_name += '_delta'
+        settings['output_files'] = {table_name: '-'}
+    if 'starting_path' in settings:
+        settings['starting_path'] = os.path.join(settings['starting_path'], '')
+    configure(**settings)
+    export(predicate)
+
+
+if __name__ == '__main__':
+    main()